@@ -1,12 +1,26 @@
 #!/usr/bin/env python3
+import atexit
+import codecs
+import concurrent.futures
+import ctypes
+import errno
+import fcntl
+import functools
+import heapq
 import logging
 import logging.handlers
 import os
+import re
+import select
 import shutil
+import struct
 import subprocess
+import threading
 import time
-from datetime import datetime, timezone
+from collections.abc import Mapping
+from dataclasses import dataclass, fields
 from pathlib import Path
+from typing import Any
 
 
 # ---------------------------------------------------------------------------
@@ -42,7 +56,47 @@ def setup_logging(log_dir: Path) -> None:
     )
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(fmt)
-    _logger.addHandler(file_handler)
+    _logger.addHandler(_buffered(file_handler))
+
+
+def _buffered(target: logging.Handler) -> logging.handlers.MemoryHandler:
+    """
+    Wrap a file handler so records are written in batches.
+
+    Records are flushed when the buffer fills, on ERROR or above, and on every
+    poll tick via flush_log_buffers().
+    """
+    buf = logging.handlers.MemoryHandler(
+        capacity=512,
+        flushLevel=logging.ERROR,
+        target=target,
+        flushOnClose=True,
+    )
+    buf.setLevel(target.level)
+    return buf
+
+
+def flush_log_buffers(*loggers: logging.Logger) -> None:
+    for logger in loggers:
+        for h in logger.handlers:
+            h.flush()
+
+
+def _close_job_logger(job_logger: logging.Logger) -> None:
+    """Flush and close the per-job handlers, including buffered targets.
+
+    StreamHandler.close() leaves its stream open, so the per-job log stream
+    (and its fd) is closed here explicitly.
+    """
+    for h in job_logger.handlers[:]:
+        target = getattr(h, "target", None)
+        h.close()
+        if target is not None:
+            stream = getattr(target, "stream", None)
+            target.close()
+            if stream is not None and not stream.closed:
+                stream.close()
+        job_logger.removeHandler(h)
 
 
 def _make_job_logger(log_dir: Path, job_id: str) -> logging.Logger:
@@ -54,13 +108,15 @@ def _make_job_logger(log_dir: Path, job_id: str) -> logging.Logger:
         datefmt="%Y-%m-%dT%H:%M:%SZ",
     )
     fmt.converter = time.gmtime
-    fh = logging.FileHandler(
+    fd = os.open(
         log_dir / "jobs" / f"{job_id}.log",
-        encoding="utf-8",
+        os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+        0o644,
     )
+    fh = logging.StreamHandler(os.fdopen(fd, "w", buffering=8192, encoding="utf-8"))
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(fmt)
-    job_logger.addHandler(fh)
+    job_logger.addHandler(_buffered(fh))
     return job_logger
 
 
@@ -69,18 +125,30 @@ def _make_job_logger(log_dir: Path, job_id: str) -> logging.Logger:
 # ---------------------------------------------------------------------------
 
 
+# KEY=VALUE per line, optionally prefixed with "export "; comment lines are
+# skipped. [ \t] instead of \s keeps a match from running across line
+# boundaries (e.g. an empty value).
+_ENV_LINE_RE = re.compile(
+    rb"(?m)^(?![ \t]*#)[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$"
+)
+
+
+# env file -> st_mtime_ns of the last parsed version.
+_env_file_loaded: dict[Path, int] = {}
+
+
 def load_env_file(env_file: Path) -> None:
-    if not env_file.is_file():
+    try:
+        mtime_ns = os.stat(env_file).st_mtime_ns
+        if _env_file_loaded.get(env_file) == mtime_ns:
+            return
+        data = env_file.read_bytes()
+    except OSError:
         return
-    for raw_line in env_file.read_text(encoding="utf-8").splitlines():
-        line = raw_line.strip()
-        if not line or line.startswith("#") or "=" not in line:
-            continue
-        key, value = line.split("=", 1)
-        key = key.strip()
-        value = value.strip()
-        if key and key not in os.environ:
-            os.environ[key] = value
+    _env_file_loaded[env_file] = mtime_ns
+    # Editors on Windows may prepend a UTF-8 BOM to the first key.
+    for key, value in _ENV_LINE_RE.findall(data.removeprefix(codecs.BOM_UTF8)):
+        os.environ.setdefault(key.decode("ascii"), value.decode("utf-8"))
 
 
 def env_int(name: str, default: int) -> int:
@@ -90,11 +158,14 @@ def env_int(name: str, default: int) -> int:
     return int(value)
 
 
+_TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
+
+
 def env_bool(name: str, default: bool) -> bool:
     value = os.environ.get(name)
     if value is None or value == "":
         return default
-    return value.strip().lower() in {"1", "true", "yes", "y", "on"}
+    return value.strip().lower() in _TRUTHY
 
 
 # ---------------------------------------------------------------------------
@@ -150,10 +221,17 @@ def resolve_persistent_trigger_path(script_dir: Path) -> Path | None:
 
 
 def read_float(path: Path) -> float:
+    # State files hold one short float; a single pread avoids the text layer.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return 0.0
     try:
-        return float(path.read_text(encoding="utf-8").strip())
+        return float(os.pread(fd, 64, 0))
     except (OSError, ValueError):
         return 0.0
+    finally:
+        os.close(fd)
 
 
 def write_float(path: Path, value: float) -> None:
@@ -161,25 +239,46 @@ def write_float(path: Path, value: float) -> None:
     path.write_text(f"{value}\n", encoding="utf-8")
 
 
+# Last handled trigger mtime per state file, keyed by the file's
+# (st_ino, st_mtime_ns) when it was read or written. A stat per poll is
+# enough to reuse it; deleting or editing the file by hand (to re-arm the
+# trigger) changes the key and forces a re-read.
+_trigger_handled: dict[Path, tuple[tuple[int, int] | None, float]] = {}
+
+
+def _state_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
 def should_fire_persistent_trigger(persistent_trigger: Path, state_dir: Path) -> bool:
-    if not persistent_trigger.exists():
-        return False
-    state_file = state_dir / "trigger" / f"{persistent_trigger.name}.mtime"
-    last_handled = read_float(state_file)
+    # One stat answers both "does it exist" and "has it been touched".
     try:
-        current = persistent_trigger.stat().st_mtime
+        current = os.stat(persistent_trigger).st_mtime
     except OSError:
         return False
+    state_file = state_dir / "trigger" / f"{persistent_trigger.name}.mtime"
+    key = _state_key(state_file)
+    cached = _trigger_handled.get(state_file)
+    if cached is not None and cached[0] == key:
+        last_handled = cached[1]
+    else:
+        last_handled = read_float(state_file)
+        _trigger_handled[state_file] = (key, last_handled)
     return current > last_handled
 
 
 def mark_persistent_trigger_handled(persistent_trigger: Path, state_dir: Path) -> None:
-    state_file = state_dir / "trigger" / f"{persistent_trigger.name}.mtime"
     try:
-        current = persistent_trigger.stat().st_mtime
+        current = os.stat(persistent_trigger).st_mtime
     except OSError:
         return
+    state_file = state_dir / "trigger" / f"{persistent_trigger.name}.mtime"
     write_float(state_file, current)
+    _trigger_handled[state_file] = (_state_key(state_file), current)
 
 
 def consume_start_trigger_if_needed(
@@ -219,26 +318,114 @@ def ensure_default_prompt(task_prompt_file: Path) -> None:
     _logger.info("[scan] Created default task prompt at %s", task_prompt_file)
 
 
+def _create_claim(claim_path: Path, zip_path: Path) -> None:
+    """Atomically create *claim_path* recording *zip_path*; FileExistsError if taken."""
+    fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    try:
+        os.write(fd, os.fsencode(zip_path))
+    finally:
+        os.close(fd)
+
+
 def claim_job(state_queue: Path, running_dir: Path, zip_path: Path) -> str | None:
     job_id = zip_path.stem
     claim_path = state_queue / f"{job_id}.claimed"
     try:
-        os.symlink(str(zip_path), str(claim_path))
+        _create_claim(claim_path, zip_path)
         return job_id
     except FileExistsError:
         # Recover stale claims left behind by an interrupted orchestrator.
         if not (running_dir / job_id).exists():
             try:
-                claim_path.unlink(missing_ok=True)
-                os.symlink(str(zip_path), str(claim_path))
+                os.unlink(claim_path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                return None
+            try:
+                _create_claim(claim_path, zip_path)
                 return job_id
             except OSError:
                 return None
         return None
 
 
+# Running markers are only written by this process, so the count is kept in
+# memory and re-read from disk every RUNNING_RECONCILE_SECONDS to self-heal
+# after crashes or manual edits of the state dir.
+RUNNING_RECONCILE_SECONDS = 60
+_running_lock = threading.Lock()
+_running_count = 0
+_running_scanned_at = float("-inf")
+
+
+def reconcile_running_count(running_dir: Path) -> int:
+    """Recount running markers on disk and reset the in-memory counter."""
+    global _running_count, _running_scanned_at
+    with _running_lock:
+        with os.scandir(running_dir) as it:
+            _running_count = sum(1 for e in it if e.is_file())
+        _running_scanned_at = time.monotonic()
+        return _running_count
+
+
 def running_jobs_count(running_dir: Path) -> int:
-    return sum(1 for p in running_dir.iterdir() if p.is_file())
+    if time.monotonic() - _running_scanned_at >= RUNNING_RECONCILE_SECONDS:
+        return reconcile_running_count(running_dir)
+    return _running_count
+
+
+def _adjust_running_count(delta: int) -> None:
+    global _running_count
+    with _running_lock:
+        _running_count = max(0, _running_count + delta)
+
+
+# done/ and failed/ marker names per directory, keyed by the directory's
+# st_mtime_ns. start_job drops the entry whenever it adds or removes a marker.
+_marker_cache: dict[Path, tuple[int, frozenset[str]]] = {}
+
+
+def marker_ids(marker_dir: Path) -> frozenset[str]:
+    """Return the marker names in *marker_dir*, rescanning only when it changed."""
+    mtime_ns = os.stat(marker_dir).st_mtime_ns
+    cached = _marker_cache.get(marker_dir)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    with os.scandir(marker_dir) as it:
+        names = frozenset(e.name for e in it)
+    # Same-tick changes would not move the mtime; don't cache fresh ones.
+    if time.time_ns() - mtime_ns > 1_000_000_000:
+        _marker_cache[marker_dir] = (mtime_ns, names)
+    return names
+
+
+def _forget_markers(marker_dir: Path) -> None:
+    _marker_cache.pop(marker_dir, None)
+
+
+def list_input_zips(input_dir: Path) -> list[str]:
+    """Return the sorted names of the .zip files in *input_dir*."""
+    with os.scandir(input_dir) as it:
+        return sorted(e.name for e in it if e.name.endswith(".zip") and e.is_file())
+
+
+def input_zip_heap(input_dir: Path) -> list[str]:
+    """
+    Return the .zip names in *input_dir* as a heap.
+
+    The dispatcher pops names in sorted order and usually stops after the
+    first few, so the full sort of a large backlog is never paid for.
+    """
+    with os.scandir(input_dir) as it:
+        heap = [e.name for e in it if e.name.endswith(".zip") and e.is_file()]
+    heapq.heapify(heap)
+    return heap
+
+
+# (output_dir, job_id) -> (dir mtime_ns, path, N). Adding, removing or
+# renaming an entry bumps the directory mtime, so one stat validates it.
+_latest_zip_cache: dict[tuple[Path, str], tuple[int, Path | None, int]] = {}
 
 
 def find_latest_version_zip(output_dir: Path, job_id: str) -> tuple[Path | None, int]:
@@ -246,21 +433,33 @@ def find_latest_version_zip(output_dir: Path, job_id: str) -> tuple[Path | None,
     Find the latest <job_id>_vN.zip in output_dir.
     Returns (path, N). If none found, returns (None, 0).
     """
+    key = (output_dir, job_id)
+    mtime_ns = os.stat(output_dir).st_mtime_ns
+    cached = _latest_zip_cache.get(key)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1], cached[2]
+
     best_n = 0
-    best_path: Path | None = None
+    best_name: str | None = None
     prefix = f"{job_id}_v"
-    for p in output_dir.glob(f"{job_id}_v*.zip"):
-        name = p.name
-        if not name.startswith(prefix):
-            continue
-        try:
+    # Names come straight from the readdir stream: no Path objects, no stat().
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            name = entry.name
+            if not (name.startswith(prefix) and name.endswith(".zip")):
+                continue
             n_part = name[len(prefix) : -len(".zip")]
+            if not (n_part.isascii() and n_part.isdigit()):
+                continue
             n = int(n_part)
-        except ValueError:
-            continue
-        if n > best_n:
-            best_n = n
-            best_path = p
+            if n > best_n:
+                best_n = n
+                best_name = name
+    best_path = output_dir / best_name if best_name is not None else None
+    # A change landing in the same timestamp tick as our scan would leave
+    # the mtime unchanged; only trust mtimes that are safely in the past.
+    if time.time_ns() - mtime_ns > 1_000_000_000:
+        _latest_zip_cache[key] = (mtime_ns, best_path, best_n)
     return best_path, best_n
 
 
@@ -277,15 +476,86 @@ def ensure_worker_writable_dir(path: Path, jlog: logging.Logger) -> None:
 
 
 # ---------------------------------------------------------------------------
-# Atomic copy helper
+# Copy helpers
 # ---------------------------------------------------------------------------
 
+FICLONE = 0x40049409
+_COPY_FALLBACK_ERRNOS = frozenset(
+    {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.EPERM}
+)
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """
+    Copy count bytes starting at offset in src_fd to the current position of dst_fd.
+
+    Uses copy_file_range() so data stays in the kernel, falling back to
+    sendfile() and finally a pread/write loop when the filesystem refuses.
+    Some filesystems (FUSE, CIFS) refuse by returning 0 instead of an
+    error, so a 0 only ends the copy when the source really is at EOF.
+    """
+    end = offset + count
+    for method in ("copy_file_range", "sendfile"):
+        try:
+            while offset < end:
+                if method == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, end - offset, offset)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, offset, end - offset)
+                if n == 0:
+                    break
+                offset += n
+        except AttributeError:
+            continue
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+            continue
+        if offset >= end or offset >= os.fstat(src_fd).st_size:
+            return
+    while offset < end:
+        data = os.pread(src_fd, min(end - offset, 1 << 20), offset)
+        if not data:
+            return
+        os.write(dst_fd, data)
+        offset += len(data)
+
+
+def fast_copy(src: Path, dst: Path) -> None:
+    """
+    Copy src to dst with data and metadata, like shutil.copy2.
+
+    Tries a FICLONE reflink first (instant on Btrfs/XFS), then an in-kernel
+    copy via _copy_range, so large zips never pass through a Python buffer.
+    """
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            size = os.fstat(src_fd).st_size
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            except OSError:
+                _copy_range(src_fd, dst_fd, 0, size)
+            copied = os.fstat(dst_fd).st_size
+            if copied != size:
+                raise OSError(errno.EIO, f"short copy ({copied} of {size} bytes)", str(dst))
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+
 
 def atomic_copy(src: Path, dst: Path) -> None:
     """Copy src to dst using a .tmp intermediate + rename for crash safety."""
     dst.parent.mkdir(parents=True, exist_ok=True)
     tmp = dst.with_suffix(dst.suffix + ".tmp")
-    shutil.copy2(src, tmp)
+    try:
+        fast_copy(src, tmp)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
     tmp.rename(dst)
 
 
@@ -294,60 +564,98 @@ def atomic_copy(src: Path, dst: Path) -> None:
 # ---------------------------------------------------------------------------
 
 
+def open_combined_log(nc_log_path: Path) -> int:
+    """
+    Open the combined Nextcloud log once per job, positioned at EOF.
+
+    No O_APPEND: copy_file_range() rejects append-mode destinations, so each
+    write in sync_iter_logs advances the file offset instead.
+    """
+    nc_log_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(nc_log_path, os.O_WRONLY | os.O_CREAT, 0o644)
+    os.lseek(fd, 0, os.SEEK_END)
+    return fd
+
+
+def list_iter_logs(work_logs_dir: Path) -> list[Path]:
+    """Return the sorted iter-N.log files in *work_logs_dir* (empty if missing)."""
+    if not work_logs_dir.is_dir():
+        return []
+    return sorted(work_logs_dir.glob("iter-*.log"))
+
+
 def sync_iter_logs(
     work_logs_dir: Path,
-    nc_log_path: Path,
+    combined_fd: int,
     synced_offsets: dict[str, int],
     jlog: logging.Logger,
+    iter_files: list[Path] | None = None,
+    *,
+    stable: set[str] | None = None,
+    stable_after: float = 0.0,
 ) -> None:
     """
     Scan WORK_DIR/<job_id>/tmp/logs/ for iter-N.log files.
-    Build/append to a combined rolling log at nc_log_path.
+    Append new output to the combined rolling log open at combined_fd.
     Track bytes already synced per file to avoid re-reading.
-    """
-    if not work_logs_dir.is_dir():
-        return
 
-    iter_files = sorted(work_logs_dir.glob("iter-*.log"))
+    Callers that have just listed the directory pass *iter_files* to skip
+    the rescan. When a *stable* set is given, fully synced files untouched
+    for more than *stable_after* seconds are added to it and no longer
+    stat'ed; the caller removes names from it when they change again.
+    """
+    if iter_files is None:
+        iter_files = list_iter_logs(work_logs_dir)
     if not iter_files:
         return
 
-    nc_log_path.parent.mkdir(parents=True, exist_ok=True)
-
-    with nc_log_path.open("a", encoding="utf-8") as combined:
-        for iter_file in iter_files:
-            fname = iter_file.name
-            offset = synced_offsets.get(fname, 0)
-            try:
-                size = iter_file.stat().st_size
-            except OSError:
-                continue
-            if size <= offset:
-                continue
+    synced = 0
+    for iter_file in iter_files:
+        fname = iter_file.name
+        if stable is not None and fname in stable:
+            continue
+        offset = synced_offsets.get(fname, 0)
+        try:
+            st = iter_file.stat()
+        except OSError:
+            continue
+        size = st.st_size
+        if size <= offset:
+            if stable is not None and time.time() - st.st_mtime > stable_after:
+                stable.add(fname)
+            continue
 
+        try:
+            src_fd = os.open(iter_file, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
             # If this is the first time we see this file, write a header
             if offset == 0:
                 # Extract iteration number for the header
-                try:
-                    mtime = datetime.fromtimestamp(
-                        iter_file.stat().st_mtime, tz=timezone.utc
-                    )
-                    ts_str = mtime.strftime("%Y-%m-%d %H:%M:%S")
-                except OSError:
-                    ts_str = "unknown"
+                ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(st.st_mtime))
                 iter_num = fname.replace("iter-", "").replace(".log", "")
-                combined.write(
-                    f"\n=== Iteration {iter_num} started {ts_str} ===\n\n"
+                os.write(
+                    combined_fd,
+                    f"\n=== Iteration {iter_num} started {ts_str} ===\n\n".encode(),
                 )
 
-            with iter_file.open("r", encoding="utf-8", errors="ignore") as f:
-                f.seek(offset)
-                new_data = f.read()
-                combined.write(new_data)
-
-            synced_offsets[fname] = size
+            # Copy exactly up to the size we stat'ed; bytes written after
+            # that are picked up on the next tick.
+            _copy_range(src_fd, combined_fd, offset, size - offset)
+            # The copied range is never read again; drop it from the page
+            # cache.
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(src_fd, offset, size - offset, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(src_fd)
+        synced_offsets[fname] = size
+        synced += 1
+
+    if not synced:
+        return
 
-    jlog.debug("[sync] synced iteration logs to %s", nc_log_path)
+    jlog.debug("[sync] synced %d iteration log(s)", synced)
 
 
 def write_nc_status(
@@ -360,43 +668,43 @@ def write_nc_status(
     nc_status_path.write_text(f"{state} | {detail}\n", encoding="utf-8")
 
 
-def sync_output_zips(
+def sync_output_dir(
     local_output_dir: Path,
     nc_output_dir: Path,
     synced_zips: set[str],
     jlog: logging.Logger,
+    names: list[str] | None = None,
 ) -> None:
-    """Copy new .zip files (not .partial.zip) from local output to Nextcloud."""
-    if not local_output_dir.is_dir():
-        return
-    for zp in local_output_dir.iterdir():
-        if not zp.name.endswith(".zip"):
+    """
+    Copy new .zip files (not .partial.zip) and .status files from local
+    output to Nextcloud in a single pass.
+
+    When names is given (finished files reported by the watcher) only those
+    are considered; otherwise the directory is scanned once.
+    """
+    if names is None:
+        try:
+            with os.scandir(local_output_dir) as it:
+                names = [e.name for e in it]
+        except (FileNotFoundError, NotADirectoryError):
+            return
+    for name in dict.fromkeys(names):
+        if name.endswith(".status"):
+            try:
+                atomic_copy(local_output_dir / name, nc_output_dir / name)
+            except OSError as e:
+                jlog.warning("[sync] failed to copy status %s: %s", name, e)
             continue
-        if zp.name.endswith(".partial.zip"):
+        if not name.endswith(".zip") or name.endswith(".partial.zip"):
             continue
-        if zp.name in synced_zips:
+        if name in synced_zips:
             continue
         try:
-            atomic_copy(zp, nc_output_dir / zp.name)
-            synced_zips.add(zp.name)
-            jlog.info("[sync] copied output %s to Nextcloud", zp.name)
+            atomic_copy(local_output_dir / name, nc_output_dir / name)
+            synced_zips.add(name)
+            jlog.info("[sync] copied output %s to Nextcloud", name)
         except OSError as e:
-            jlog.warning("[sync] failed to copy %s: %s", zp.name, e)
-
-
-def sync_output_status_files(
-    local_output_dir: Path,
-    nc_output_dir: Path,
-    jlog: logging.Logger,
-) -> None:
-    """Copy .status files from local output to Nextcloud."""
-    if not local_output_dir.is_dir():
-        return
-    for sf in local_output_dir.glob("*.status"):
-        try:
-            atomic_copy(sf, nc_output_dir / sf.name)
-        except OSError as e:
-            jlog.warning("[sync] failed to copy status %s: %s", sf.name, e)
+            jlog.warning("[sync] failed to copy %s: %s", name, e)
 
 
 def run_post_sync_hook(
@@ -407,10 +715,14 @@ def run_post_sync_hook(
     nc_output_dir: Path,
     nc_log_dir: Path | None,
     jlog: logging.Logger,
+    output_path: Path | None = None,
 ) -> None:
     """
     Optionally run a post-sync hook command after each job.
     Useful for external indexers (e.g., Nextcloud occ files:scan).
+
+    The hook's stdout/stderr are redirected straight into *output_path*
+    (normally the job log) instead of being captured through pipes.
     """
     if not command:
         return
@@ -421,37 +733,249 @@ def run_post_sync_hook(
     env["NC_LOG_DIR"] = str(nc_log_dir) if nc_log_dir else ""
 
     jlog.info("[hook] running POST_SYNC_HOOK_CMD for job %s", job_id)
-    try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            env=env,
-            capture_output=True,
-            text=True,
-            timeout=timeout_seconds,
-        )
-    except subprocess.TimeoutExpired:
-        jlog.warning("[hook] POST_SYNC_HOOK_CMD timed out after %ds", timeout_seconds)
-        return
-    except OSError as e:
-        jlog.warning("[hook] POST_SYNC_HOOK_CMD failed to start: %s", e)
-        return
+    # Hook output lands in the same file; keep it after our own lines.
+    flush_log_buffers(jlog)
 
-    if result.stdout.strip():
-        jlog.info("[hook] stdout: %s", result.stdout.strip())
-    if result.stderr.strip():
-        jlog.warning("[hook] stderr: %s", result.stderr.strip())
+    out_fd = subprocess.DEVNULL
+    if output_path is not None:
+        try:
+            out_fd = os.open(output_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except OSError as e:
+            jlog.warning("[hook] cannot open %s for hook output: %s", output_path, e)
 
-    if result.returncode != 0:
-        jlog.warning("[hook] POST_SYNC_HOOK_CMD exited with rc=%d", result.returncode)
+    try:
+        try:
+            proc = subprocess.Popen(
+                command,
+                shell=True,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=out_fd,
+                stderr=out_fd,
+            )
+        except OSError as e:
+            jlog.warning("[hook] POST_SYNC_HOOK_CMD failed to start: %s", e)
+            return
+        try:
+            rc = proc.wait(timeout=timeout_seconds)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            jlog.warning("[hook] POST_SYNC_HOOK_CMD timed out after %ds", timeout_seconds)
+            return
+    finally:
+        if out_fd >= 0:
+            os.close(out_fd)
+
+    if rc != 0:
+        jlog.warning("[hook] POST_SYNC_HOOK_CMD exited with rc=%d", rc)
     else:
         jlog.info("[hook] POST_SYNC_HOOK_CMD completed")
 
 
+# ---------------------------------------------------------------------------
+# Filesystem change watcher (Linux inotify via ctypes)
+# ---------------------------------------------------------------------------
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+
+# Watched directories are rescanned in full at least this often, in case
+# inotify dropped events without reporting an overflow.
+WATCH_RESCAN_SECONDS = 60
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+@functools.cache
+def _load_libc() -> ctypes.CDLL | None:
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class DirWatcher:
+    """
+    Watch a few directories for changes using inotify.
+
+    read_events() drains pending events without blocking and returns
+    (key, filename, mask) tuples. It returns None when inotify is unavailable
+    (non-Linux, watch limit reached) or the event queue overflowed, in which
+    case callers should assume everything changed and rescan.
+    """
+
+    def __init__(self, dirs: dict[str, Path], mask: int) -> None:
+        self._fd = -1
+        self._keys: dict[int, str] = {}
+        libc = _load_libc()
+        if libc is None:
+            return
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return
+        for key, d in dirs.items():
+            wd = libc.inotify_add_watch(fd, os.fsencode(d), mask)
+            if wd < 0:
+                os.close(fd)
+                self._keys.clear()
+                return
+            self._keys[wd] = key
+        self._fd = fd
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def read_events(self) -> list[tuple[str, str, int]] | None:
+        if self._fd < 0:
+            return None
+        events: list[tuple[str, str, int]] = []
+        overflow = False
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buf):
+                wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(buf, pos)
+                pos += _INOTIFY_EVENT.size
+                name = os.fsdecode(buf[pos : pos + length].rstrip(b"\0"))
+                pos += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                key = self._keys.get(wd)
+                if key is not None:
+                    events.append((key, name, mask))
+        return None if overflow else events
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class LoopWaiter:
+    """
+    Sleep between main-loop polls, waking early when something happens.
+
+    Wakes on new files (or touched triggers) in the watched directories and
+    whenever notify() is called, e.g. from a job's done-callback. Without
+    inotify only notify() can cut the sleep short.
+    """
+
+    def __init__(self, dirs: dict[str, Path]) -> None:
+        self._watcher = DirWatcher(
+            {key: d for key, d in dirs.items() if d.is_dir()},
+            IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ATTRIB,
+        )
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def notify(self) -> None:
+        """Wake the waiting thread; safe to call from any thread."""
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # a wake-up is already pending
+
+    def wait(self, timeout: float) -> None:
+        fds = [self._wake_r]
+        if self._watcher.fileno() >= 0:
+            fds.append(self._watcher.fileno())
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self._watcher.fileno() in ready:
+            self._watcher.read_events()
+        if self._wake_r in ready:
+            try:
+                while os.read(self._wake_r, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        self._watcher.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+
+def _open_pidfd(pid: int) -> int:
+    """Return a pidfd for pid (readable once the process exits), or -1."""
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return -1
+
+
+def _wait_for_exit(pidfd: int, timeout: float) -> None:
+    """Sleep up to timeout seconds, returning early if the pidfd signals exit."""
+    if pidfd < 0:
+        time.sleep(timeout)
+        return
+    select.select([pidfd], [], [], timeout)
+
+
 # ---------------------------------------------------------------------------
 # start_job — rewritten with Popen + poll loop
 # ---------------------------------------------------------------------------
 
+# Job-independent part of the worker's `-e` arguments.
+_WORKER_FIXED_ENV_ARGS = (
+    "-e", "INPUT_ZIP=/job/input.zip",
+    "-e", "OUTPUT_DIR=/job/output",
+    "-e", "TASK_PROMPT_FILE=/job/task_prompt.txt",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerEnv:
+    """
+    Worker settings passed through from the orchestrator's environment.
+
+    Each field maps to the upper-cased env var of the same name; the field
+    default is used when the variable is unset. Built once in main().
+    """
+
+    max_iterations: str = "8"
+    max_seconds: str = "3600"
+    iter_timeout_seconds: str = "600"
+    soft_stop_margin_seconds: str = "90"
+    claude_cmd: str = "claude"
+    claude_args: str = "--print"
+    claude_input_mode: str = "stdin"
+    complete_signal: str = "RALPH_COMPLETE"
+    max_consecutive_transient_errors: str = "4"
+    transient_backoff_seconds: str = "20"
+    zip_chain_mode: str = "0"
+    next_instruction_file: str = "next_instruction.txt"
+    result_zip_compression: str = ""
+
+    @classmethod
+    def from_environ(cls, environ: Mapping[str, str] = os.environ) -> "WorkerEnv":
+        return cls(**{f.name: environ.get(f.name.upper(), f.default) for f in fields(cls)})
+
+    def docker_env_args(self) -> tuple[str, ...]:
+        """Return the job-independent `-e NAME=value` arguments for docker compose run."""
+        return _worker_env_args(self)
+
+
+@functools.lru_cache(maxsize=8)
+def _worker_env_args(worker_env: WorkerEnv) -> tuple[str, ...]:
+    # WorkerEnv is frozen and hashable; the settings are fixed for a loop
+    # run, so the strings are built once instead of once per job.
+    return _WORKER_FIXED_ENV_ARGS + tuple(
+        arg for f in fields(worker_env) for arg in ("-e", f"{f.name.upper()}={getattr(worker_env, f.name)}")
+    )
+
 
 def start_job(
     script_dir: Path,
@@ -470,6 +994,7 @@ def start_job(
     post_sync_hook_timeout_seconds: int,
     keep_failed_marker: bool,
     version_offset: int = 0,
+    worker_env: WorkerEnv | None = None,
 ) -> bool:
     running_marker = state_dir / "running" / job_id
     done_marker = state_dir / "done" / job_id
@@ -488,215 +1013,305 @@ def start_job(
 
     _logger.info("[job] Starting job %s", job_id)
     jlog.info("[job] Starting job %s (zip=%s, version_offset=%d)", job_id, zip_path.name, version_offset)
+    _adjust_running_count(1)
     running_marker.touch()
-
-    # 2. Copy input zip to local work dir
-    local_input_zip = job_input / "input.zip"
+    # Anything that escapes below (Popen failing, a full disk, ...) must still
+    # release the inotify fd and the job log, undo the running count and leave
+    # the job as failed rather than stuck in running/.
+    running = True
+    watcher: DirWatcher | None = None
+    combined_fd = -1
     try:
-        shutil.copy2(zip_path, local_input_zip)
-        jlog.info("[job] Copied input zip to %s", local_input_zip)
-    except OSError as e:
-        jlog.error("[job] Failed to copy input zip: %s", e)
-        _logger.error("[job] Job %s failed: cannot copy input zip: %s", job_id, e)
-        running_marker.unlink(missing_ok=True)
-        if keep_failed_marker:
-            failed_marker.touch()
-        return False
 
-    # 3. Build docker command — mount LOCAL dirs only
-    env = os.environ.copy()
-    start_time = time.monotonic()
-    command = [
-        "docker",
-        "compose",
-        "-f",
-        str(script_dir / "docker-compose.yml"),
-        "run",
-        "--rm",
-        "-e", f"JOB_ID={job_id}",
-        "-e", "INPUT_ZIP=/job/input.zip",
-        "-e", "OUTPUT_DIR=/job/output",
-        "-e", "TASK_PROMPT_FILE=/job/task_prompt.txt",
-        "-e", f"MAX_ITERATIONS={env.get('MAX_ITERATIONS', '8')}",
-        "-e", f"MAX_SECONDS={env.get('MAX_SECONDS', '3600')}",
-        "-e", f"ITER_TIMEOUT_SECONDS={env.get('ITER_TIMEOUT_SECONDS', '600')}",
-        "-e", f"SOFT_STOP_MARGIN_SECONDS={env.get('SOFT_STOP_MARGIN_SECONDS', '90')}",
-        "-e", f"CLAUDE_CMD={env.get('CLAUDE_CMD', 'claude')}",
-        "-e", f"CLAUDE_ARGS={env.get('CLAUDE_ARGS', '--print')}",
-        "-e", f"CLAUDE_INPUT_MODE={env.get('CLAUDE_INPUT_MODE', 'stdin')}",
-        "-e", f"COMPLETE_SIGNAL={env.get('COMPLETE_SIGNAL', 'RALPH_COMPLETE')}",
-        "-e", f"MAX_CONSECUTIVE_TRANSIENT_ERRORS={env.get('MAX_CONSECUTIVE_TRANSIENT_ERRORS', '4')}",
-        "-e", f"TRANSIENT_BACKOFF_SECONDS={env.get('TRANSIENT_BACKOFF_SECONDS', '20')}",
-        "-e", f"ZIP_CHAIN_MODE={env.get('ZIP_CHAIN_MODE', '0')}",
-        "-e", f"NEXT_INSTRUCTION_FILE={env.get('NEXT_INSTRUCTION_FILE', 'next_instruction.txt')}",
-        "-e", f"VERSION_OFFSET={version_offset}",
-        "-v", f"{local_input_zip}:/job/input.zip:ro",
-        "-v", f"{task_prompt_file}:/job/task_prompt.txt:ro",
-        "-v", f"{job_output}:/job/output",
-        "-v", f"{job_tmp}:/tmp/work",
-        "worker",
-    ]
-
-    jlog.debug("[job] Command: %s", " ".join(command))
-
-    # 4. Launch with Popen
-    proc = subprocess.Popen(
-        command,
-        env=env,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
-    jlog.info("[job] Container started (pid=%d)", proc.pid)
+        # 2. Copy input zip to local work dir
+        local_input_zip = job_input / "input.zip"
+        try:
+            fast_copy(zip_path, local_input_zip)
+            jlog.info("[job] Copied input zip to %s", local_input_zip)
+        except OSError as e:
+            jlog.error("[job] Failed to copy input zip: %s", e)
+            _logger.error("[job] Job %s failed: cannot copy input zip: %s", job_id, e)
+            return False
+
+        # 3. Build docker command — mount LOCAL dirs only
+        start_time = time.monotonic()
+        if worker_env is None:
+            worker_env = WorkerEnv.from_environ()
+        command = [
+            "docker",
+            "compose",
+            "-f",
+            str(script_dir / "docker-compose.yml"),
+            "run",
+            "--rm",
+            "-e", f"JOB_ID={job_id}",
+            *worker_env.docker_env_args(),
+            "-e", f"VERSION_OFFSET={version_offset}",
+            "-v", f"{local_input_zip}:/job/input.zip:ro",
+            "-v", f"{task_prompt_file}:/job/task_prompt.txt:ro",
+            "-v", f"{job_output}:/job/output",
+            "-v", f"{job_tmp}:/tmp/work",
+            "worker",
+        ]
+
+        jlog.debug("[job] Command: %s", command)
+
+        # Watch logs/output before launching so no early write is missed.
+        work_logs_dir = job_tmp / "logs"
+        work_logs_dir.mkdir(parents=True, exist_ok=True)
+        ensure_worker_writable_dir(work_logs_dir, jlog)
+        watcher = DirWatcher(
+            {"logs": work_logs_dir, "output": job_output},
+            IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO,
+        )
 
-    # 5. Poll loop — sync logs and output while container runs
-    synced_offsets: dict[str, int] = {}
-    synced_zips: set[str] = set()
-    work_logs_dir = job_tmp / "logs"
-    nc_log_path = nc_log_dir / f"{job_id}.log" if nc_log_dir else None
-    nc_status_path = nc_log_dir / f"{job_id}.status" if nc_log_dir else None
+        # 4. Launch with Popen
+        proc = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        jlog.info("[job] Container started (pid=%d)", proc.pid)
+
+        # 5. Poll loop — sync logs and output while container runs.
+        # The heartbeat (log_sync_seconds) only refreshes the status line; directory
+        # scans run only when inotify reported a change in that directory, or in
+        # full after a queue overflow and every WATCH_RESCAN_SECONDS.
+        synced_offsets: dict[str, int] = {}
+        stable_logs: set[str] = set()
+        synced_zips: set[str] = set()
+        nc_log_path = nc_log_dir / f"{job_id}.log" if nc_log_dir else None
+        nc_status_path = nc_log_dir / f"{job_id}.status" if nc_log_dir else None
+        max_iter = worker_env.max_iterations
+        iter_count = 0
+        pidfd = _open_pidfd(proc.pid)
+        last_rescan = time.monotonic()
 
-    while proc.poll() is None:
-        time.sleep(log_sync_seconds)
+        try:
+            while proc.poll() is None:
+                _wait_for_exit(pidfd, log_sync_seconds)
+
+                events = watcher.read_events()
+                now = time.monotonic()
+                if events is not None and now - last_rescan >= WATCH_RESCAN_SECONDS:
+                    events = None
+                if events is None:
+                    last_rescan = now
+                    stable_logs.clear()
+                    logs_changed = True
+                else:
+                    logs_changed = False
+                    for key, name, _ in events:
+                        if key == "logs":
+                            stable_logs.discard(name)
+                            logs_changed = True
+                finished_outputs = (
+                    None
+                    if events is None
+                    else [name for key, name, mask in events if key == "output" and mask & (IN_CLOSE_WRITE | IN_MOVED_TO)]
+                )
 
+                elapsed = int(time.monotonic() - start_time)
+                elapsed_str = _format_elapsed(elapsed)
+
+                if logs_changed:
+                    # Count iterations from log files
+                    iter_files = list_iter_logs(work_logs_dir)
+                    iter_count = len(iter_files)
+
+                    if nc_log_path:
+                        try:
+                            if combined_fd < 0:
+                                combined_fd = open_combined_log(nc_log_path)
+                            sync_iter_logs(
+                                work_logs_dir,
+                                combined_fd,
+                                synced_offsets,
+                                jlog,
+                                iter_files,
+                                stable=stable_logs,
+                                stable_after=log_sync_seconds * 3,
+                            )
+                        except OSError as e:
+                            jlog.warning("[sync] log sync error: %s", e)
+
+                if nc_status_path:
+                    try:
+                        write_nc_status(
+                            nc_status_path,
+                            "running",
+                            f"iter {iter_count}/{max_iter} | elapsed {elapsed_str}",
+                        )
+                    except OSError as e:
+                        jlog.warning("[sync] status write error: %s", e)
+
+                # Sync finished output zips/status mid-run (for zip-chain crash safety)
+                if finished_outputs is None or finished_outputs:
+                    try:
+                        sync_output_dir(job_output, nc_output_dir, synced_zips, jlog, finished_outputs)
+                    except OSError as e:
+                        jlog.warning("[sync] output sync error: %s", e)
+
+                flush_log_buffers(_logger, jlog)
+        finally:
+            if pidfd >= 0:
+                os.close(pidfd)
+            watcher.close()
+
+        rc = proc.returncode
         elapsed = int(time.monotonic() - start_time)
         elapsed_str = _format_elapsed(elapsed)
 
-        # Count iterations from log files
-        iter_count = len(list(work_logs_dir.glob("iter-*.log"))) if work_logs_dir.is_dir() else 0
-        max_iter = env.get("MAX_ITERATIONS", "8")
+        jlog.info("[job] Container exited (rc=%d, elapsed=%s)", rc, elapsed_str)
 
+        # 6. Final sync (the container is gone, so one listing serves both the
+        # log sync and the iteration count)
+        final_iter_files = list_iter_logs(work_logs_dir)
+        iter_count = len(final_iter_files)
         if nc_log_path:
             try:
-                sync_iter_logs(work_logs_dir, nc_log_path, synced_offsets, jlog)
-            except OSError as e:
-                jlog.warning("[sync] log sync error: %s", e)
-
-        if nc_status_path:
-            try:
-                write_nc_status(
-                    nc_status_path,
-                    "running",
-                    f"iter {iter_count}/{max_iter} | elapsed {elapsed_str}",
-                )
+                if combined_fd < 0:
+                    combined_fd = open_combined_log(nc_log_path)
+                sync_iter_logs(work_logs_dir, combined_fd, synced_offsets, jlog, final_iter_files)
             except OSError as e:
-                jlog.warning("[sync] status write error: %s", e)
+                jlog.warning("[sync] final log sync error: %s", e)
+            finally:
+                if combined_fd >= 0:
+                    os.close(combined_fd)
+                    combined_fd = -1
 
-        # Sync output zips mid-run (for zip-chain crash safety)
         try:
-            sync_output_zips(job_output, nc_output_dir, synced_zips, jlog)
+            sync_output_dir(job_output, nc_output_dir, synced_zips, jlog)
         except OSError as e:
-            jlog.warning("[sync] output sync error: %s", e)
-
-    rc = proc.returncode
-    elapsed = int(time.monotonic() - start_time)
-    elapsed_str = _format_elapsed(elapsed)
-
-    jlog.info("[job] Container exited (rc=%d, elapsed=%s)", rc, elapsed_str)
-
-    # 6. Final sync
-    if nc_log_path:
-        try:
-            sync_iter_logs(work_logs_dir, nc_log_path, synced_offsets, jlog)
-        except OSError as e:
-            jlog.warning("[sync] final log sync error: %s", e)
-
-    try:
-        sync_output_zips(job_output, nc_output_dir, synced_zips, jlog)
-        sync_output_status_files(job_output, nc_output_dir, jlog)
-    except OSError as e:
-        jlog.warning("[sync] final output sync error: %s", e)
-
-    # Determine final status for Nextcloud status file
-    iter_count = len(list(work_logs_dir.glob("iter-*.log"))) if work_logs_dir.is_dir() else 0
-    worker_status: str | None = None
-    worker_status_file = job_output / f"{job_id}.status"
-    if worker_status_file.is_file():
-        try:
-            worker_status = worker_status_file.read_text(encoding="utf-8").strip().lower()
-        except OSError as e:
-            jlog.warning("[job] failed to read worker status file %s: %s", worker_status_file, e)
-
-    running_marker.unlink(missing_ok=True)
+            jlog.warning("[sync] final output sync error: %s", e)
 
-    success = rc == 0 and worker_status not in {"failed"}
-
-    if success:
-        done_marker.touch()
-        _logger.info("[job] Job %s completed (%d iterations, %s)", job_id, iter_count, elapsed_str)
-        jlog.info(
-            "[job] Job %s completed (%d iterations, %s, worker_status=%s)",
-            job_id,
-            iter_count,
-            elapsed_str,
-            worker_status or "unknown",
-        )
-        if nc_status_path:
-            try:
-                write_nc_status(nc_status_path, "done", f"{iter_count} iterations, {elapsed_str}")
-            except OSError:
-                pass
-    else:
-        if keep_failed_marker:
-            failed_marker.touch()
-        else:
-            failed_marker.unlink(missing_ok=True)
-        _logger.error(
-            "[job] Job %s failed (rc=%d, %d iterations, %s, worker_status=%s)",
-            job_id,
-            rc,
-            iter_count,
-            elapsed_str,
-            worker_status or "unknown",
-        )
-        jlog.error(
-            "[job] Job %s failed (rc=%d, %d iterations, %s, worker_status=%s)",
-            job_id,
-            rc,
-            iter_count,
-            elapsed_str,
-            worker_status or "unknown",
-        )
-        if nc_status_path:
+        # Determine final status for Nextcloud status file
+        worker_status: str | None = None
+        worker_status_file = job_output / f"{job_id}.status"
+        if worker_status_file.is_file():
             try:
-                detail = f"iter {iter_count}, {elapsed_str}"
-                if worker_status:
-                    detail = f"{detail}, worker_status={worker_status}"
-                write_nc_status(nc_status_path, f"failed (rc={rc})", detail)
-            except OSError:
-                pass
-
-    run_post_sync_hook(
-        post_sync_hook_cmd,
-        post_sync_hook_timeout_seconds,
-        job_id=job_id,
-        nc_output_dir=nc_output_dir,
-        nc_log_dir=nc_log_dir,
-        jlog=jlog,
-    )
+                worker_status = worker_status_file.read_text(encoding="utf-8").strip().lower()
+            except OSError as e:
+                jlog.warning("[job] failed to read worker status file %s: %s", worker_status_file, e)
 
-    # 7. Cleanup
-    _cleanup_work_dir(job_work, success, keep_work_dir, jlog)
+        running_marker.unlink(missing_ok=True)
+        _adjust_running_count(-1)
+        running = False
+
+        success = rc == 0 and worker_status not in {"failed"}
+
+        if success:
+            done_marker.touch()
+            _forget_markers(done_marker.parent)
+            _logger.info("[job] Job %s completed (%d iterations, %s)", job_id, iter_count, elapsed_str)
+            jlog.info(
+                "[job] Job %s completed (%d iterations, %s, worker_status=%s)",
+                job_id,
+                iter_count,
+                elapsed_str,
+                worker_status or "unknown",
+            )
+            if nc_status_path:
+                try:
+                    write_nc_status(nc_status_path, "done", f"{iter_count} iterations, {elapsed_str}")
+                except OSError:
+                    pass
+        else:
+            if keep_failed_marker:
+                failed_marker.touch()
+            else:
+                failed_marker.unlink(missing_ok=True)
+            _forget_markers(failed_marker.parent)
+            _logger.error(
+                "[job] Job %s failed (rc=%d, %d iterations, %s, worker_status=%s)",
+                job_id,
+                rc,
+                iter_count,
+                elapsed_str,
+                worker_status or "unknown",
+            )
+            jlog.error(
+                "[job] Job %s failed (rc=%d, %d iterations, %s, worker_status=%s)",
+                job_id,
+                rc,
+                iter_count,
+                elapsed_str,
+                worker_status or "unknown",
+            )
+            if nc_status_path:
+                try:
+                    detail = f"iter {iter_count}, {elapsed_str}"
+                    if worker_status:
+                        detail = f"{detail}, worker_status={worker_status}"
+                    write_nc_status(nc_status_path, f"failed (rc={rc})", detail)
+                except OSError:
+                    pass
 
-    # Close job logger handlers
-    for h in jlog.handlers[:]:
-        h.close()
-        jlog.removeHandler(h)
+        run_post_sync_hook(
+            post_sync_hook_cmd,
+            post_sync_hook_timeout_seconds,
+            job_id=job_id,
+            nc_output_dir=nc_output_dir,
+            nc_log_dir=nc_log_dir,
+            jlog=jlog,
+            output_path=log_dir / "jobs" / f"{job_id}.log",
+        )
 
-    return success
+        # 7. Cleanup
+        _cleanup_work_dir(job_work, success, keep_work_dir, jlog)
+        return success
+    finally:
+        if watcher is not None:
+            watcher.close()
+        if combined_fd >= 0:
+            os.close(combined_fd)
+        if running:
+            running_marker.unlink(missing_ok=True)
+            _adjust_running_count(-1)
+            if keep_failed_marker:
+                failed_marker.touch()
+                _forget_markers(failed_marker.parent)
+        _close_job_logger(jlog)
 
 
 def _format_elapsed(seconds: int) -> str:
     if seconds < 60:
         return f"{seconds}s"
-    minutes = seconds // 60
-    secs = seconds % 60
+    minutes, secs = divmod(seconds, 60)
     if minutes < 60:
         return f"{minutes}m{secs:02d}s"
-    hours = minutes // 60
-    mins = minutes % 60
+    hours, mins = divmod(minutes, 60)
     return f"{hours}h{mins:02d}m"
 
 
+# Work dirs are renamed out of the way and deleted here, so a large tree
+# does not hold up the job thread (or the dispatcher in strict mode).
+_cleanup_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="rmtree")
+atexit.register(_cleanup_pool.shutdown, wait=True)
+
+
+def _remove_tree(path: Path) -> None:
+    """Remove *path* now from the caller's view; delete its contents in the background."""
+    trash = path.with_name(f".{path.name}.deleting-{os.getpid()}-{time.monotonic_ns()}")
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    _cleanup_pool.submit(shutil.rmtree, trash, ignore_errors=True)
+
+
+def _sweep_removed_trees(work_dir: Path) -> int:
+    """Delete trees _remove_tree renamed away but a previous run never finished."""
+    with os.scandir(work_dir) as it:
+        trash = [e.path for e in it if e.name.startswith(".") and ".deleting-" in e.name]
+    for path in trash:
+        _cleanup_pool.submit(shutil.rmtree, path, ignore_errors=True)
+    return len(trash)
+
+
 def _cleanup_work_dir(
     job_work: Path,
     success: bool,
@@ -707,12 +1322,12 @@ def _cleanup_work_dir(
         jlog.debug("[job] Keeping work dir (KEEP_WORK_DIR=always): %s", job_work)
         return
     if keep_work_dir == "never":
-        shutil.rmtree(job_work, ignore_errors=True)
+        _remove_tree(job_work)
         jlog.debug("[job] Removed work dir (KEEP_WORK_DIR=never): %s", job_work)
         return
     # Default: on_failure
     if success:
-        shutil.rmtree(job_work, ignore_errors=True)
+        _remove_tree(job_work)
         jlog.debug("[job] Removed work dir (success): %s", job_work)
     else:
         jlog.info("[job] Keeping work dir for debugging (failure): %s", job_work)
@@ -723,6 +1338,38 @@ def _cleanup_work_dir(
 # ---------------------------------------------------------------------------
 
 
+def _idle(seconds: int, waiter: LoopWaiter | None = None) -> None:
+    """Wait between polls, flushing buffered log records first."""
+    flush_log_buffers(_logger)
+    if waiter is None:
+        time.sleep(seconds)
+    else:
+        waiter.wait(seconds)
+
+
+def _run_claimed_job(claim_path: Path, *args: Any, **kwargs: Any) -> bool:
+    """Run start_job on a pool thread and release the queue claim afterwards."""
+    try:
+        return start_job(*args, **kwargs)
+    finally:
+        claim_path.unlink(missing_ok=True)
+
+
+def _reap_jobs(in_flight: dict[concurrent.futures.Future, str]) -> list[str]:
+    """Drop finished futures from *in_flight*; return the ids of failed jobs."""
+    failed: list[str] = []
+    for fut in [f for f in in_flight if f.done()]:
+        job_id = in_flight.pop(fut)
+        try:
+            ok = fut.result()
+        except Exception:
+            _logger.exception("[job] Job %s crashed", job_id)
+            ok = False
+        if not ok:
+            failed.append(job_id)
+    return failed
+
+
 def main() -> None:
     script_dir = Path(__file__).resolve().parent
     env_file = Path(os.environ.get("ENV_FILE", str(script_dir / ".env")))
@@ -749,26 +1396,39 @@ def main() -> None:
     persistent_trigger_path = resolve_persistent_trigger_path(script_dir)
     strict_single_zip = env_bool("STRICT_SINGLE_ZIP_CONTRACT", False)
     strict_allow_versioned_inputs = env_bool("STRICT_ALLOW_VERSIONED_INPUTS", False)
+    worker_env = WorkerEnv.from_environ()
 
     # Initialize logging
     setup_logging(log_dir)
 
-    for path in [
-        input_dir,
-        nc_output_dir,
-        state_dir / "queue",
-        state_dir / "running",
-        state_dir / "done",
-        state_dir / "failed",
-        state_dir / "trigger",
-        work_dir,
-    ]:
-        path.mkdir(parents=True, exist_ok=True)
+    # State subdirectories are loop invariants; build the paths once.
+    queue_dir = state_dir / "queue"
+    running_dir = state_dir / "running"
+    done_dir = state_dir / "done"
+    failed_dir = state_dir / "failed"
 
+    top_dirs = [input_dir, nc_output_dir, state_dir, work_dir]
     if nc_log_dir:
-        nc_log_dir.mkdir(parents=True, exist_ok=True)
-
+        top_dirs.append(nc_log_dir)
+    for path in top_dirs:
+        path.mkdir(parents=True, exist_ok=True)
     ensure_default_prompt(task_prompt_file)
+    swept = _sweep_removed_trees(work_dir)
+    if swept:
+        _logger.info("[loop] removing %d leftover work dir(s) from a previous run", swept)
+
+    # On restarts the state subdirectories almost always exist already; one
+    # listing replaces a mkdir per directory.
+    with os.scandir(state_dir) as it:
+        existing = {e.name for e in it if e.is_dir()}
+    for name in ("queue", "running", "done", "failed", "trigger"):
+        if name not in existing:
+            (state_dir / name).mkdir(exist_ok=True)
+
+    stale_running = reconcile_running_count(running_dir)
+    if stale_running:
+        _logger.warning("[loop] %d running marker(s) left in %s at startup", stale_running, running_dir)
+
     if trigger_path is not None or persistent_trigger_path is not None:
         _logger.info(
             "[trigger] Ralph loop started (trigger-gated). "
@@ -782,31 +1442,63 @@ def main() -> None:
     else:
         _logger.info("[trigger] Ralph loop started. Input: %s  Output: %s", input_dir, nc_output_dir)
 
+    # Claimed jobs run on pool threads so MAX_PARALLEL containers can overlap;
+    # the loop itself only polls, claims and reaps.
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="job")
+    in_flight: dict[concurrent.futures.Future, str] = {}
+    # A finished job wakes the loop at once, so a failed job is held back
+    # in memory for one poll interval before it may be claimed again.
+    retry_after: dict[str, float] = {}
+
+    # Sleep until the next poll, but wake as soon as a zip lands, a trigger
+    # is touched or a job finishes.
+    watch_dirs = {"input": input_dir}
+    if trigger_path is not None:
+        watch_dirs["trigger"] = trigger_path.parent
+    if persistent_trigger_path is not None:
+        watch_dirs["persistent_trigger"] = persistent_trigger_path.parent
+    waiter = LoopWaiter(watch_dirs)
+
     while True:
+        failed_jobs = _reap_jobs(in_flight)
+        now = time.monotonic()
+        for job_id in failed_jobs:
+            retry_after[job_id] = now + poll_seconds
+        for job_id in [j for j, t in retry_after.items() if t <= now]:
+            del retry_after[job_id]
+        if failed_jobs and stop_loop_on_job_failure:
+            consume_start_trigger_if_needed(trigger_path, consume_trigger)
+            _logger.error(
+                "[loop] stopping due to job failure (STOP_LOOP_ON_JOB_FAILURE=1, job=%s)",
+                ", ".join(failed_jobs),
+            )
+            pool.shutdown(wait=True)
+            raise SystemExit(1)
+
         start_armed = trigger_path is not None and trigger_path.exists()
         persistent_armed = (
             persistent_trigger_path is not None and should_fire_persistent_trigger(persistent_trigger_path, state_dir)
         )
         if (trigger_path is not None or persistent_trigger_path is not None) and not (start_armed or persistent_armed):
-            time.sleep(poll_seconds)
+            _idle(poll_seconds, waiter)
             continue
 
-        if running_jobs_count(state_dir / "running") >= max_parallel:
-            time.sleep(poll_seconds)
+        if max(running_jobs_count(running_dir), len(in_flight)) >= max_parallel:
+            _idle(poll_seconds, waiter)
             continue
 
-        zips = sorted(input_dir.glob("*.zip"))
-
+        # Strict mode chains versions of a single job, so it runs inline.
         if strict_single_zip:
+            zips = list_input_zips(input_dir)
             if len(zips) == 0:
-                time.sleep(poll_seconds)
+                _idle(poll_seconds, waiter)
                 continue
             if len(zips) != 1:
                 raise SystemExit(
                     f"STRICT_SINGLE_ZIP_CONTRACT violation: expected exactly 1 zip in {input_dir}, found {len(zips)}"
                 )
 
-            zip_path = zips[0]
+            zip_path = input_dir / zips[0]
             job_id = zip_path.stem
             if (not strict_allow_versioned_inputs) and "_v" in zip_path.name:
                 raise SystemExit(
@@ -817,7 +1509,7 @@ def main() -> None:
             input_zip_for_run = latest_zip or zip_path
             version_offset = latest_n
 
-            if running_jobs_count(state_dir / "running") < max_parallel:
+            if running_jobs_count(running_dir) < max_parallel:
                 if persistent_armed and persistent_trigger_path is not None:
                     mark_persistent_trigger_handled(persistent_trigger_path, state_dir)
                 success = start_job(
@@ -836,6 +1528,7 @@ def main() -> None:
                     post_sync_hook_timeout_seconds=post_sync_hook_timeout_seconds,
                     keep_failed_marker=keep_failed_marker,
                     version_offset=version_offset,
+                    worker_env=worker_env,
                 )
                 if (not success) and stop_loop_on_job_failure:
                     consume_start_trigger_if_needed(trigger_path, consume_trigger)
@@ -852,64 +1545,69 @@ def main() -> None:
                 except OSError:
                     pass
 
-            time.sleep(poll_seconds)
+            _idle(poll_seconds, waiter)
             continue
 
-        if not zips:
+        pending_zips = input_zip_heap(input_dir)
+        if not pending_zips:
             if start_armed and consume_trigger and trigger_path is not None and trigger_path.exists():
                 try:
                     trigger_path.unlink()
                     _logger.info("[trigger] Consumed start trigger file: %s", trigger_path)
                 except OSError:
                     pass
-            time.sleep(poll_seconds)
+            _idle(poll_seconds, waiter)
             continue
 
-        for zip_path in zips:
-            if running_jobs_count(state_dir / "running") >= max_parallel:
+        active_ids = set(in_flight.values())
+        done_ids = marker_ids(done_dir)
+        failed_ids = marker_ids(failed_dir)
+        while pending_zips:
+            if max(running_jobs_count(running_dir), len(in_flight)) >= max_parallel:
                 break
 
-            job_id = zip_path.stem
-            failed_marker = state_dir / "failed" / job_id
-            if failed_marker.exists() and not keep_failed_marker:
-                failed_marker.unlink(missing_ok=True)
-            if (state_dir / "done" / job_id).exists() or (state_dir / "failed" / job_id).exists():
+            zip_name = heapq.heappop(pending_zips)
+            job_id = zip_name[: -len(".zip")]
+            if job_id in active_ids or job_id in retry_after:
+                continue
+            if job_id in failed_ids:
+                if keep_failed_marker:
+                    continue
+                (failed_dir / job_id).unlink(missing_ok=True)
+                _forget_markers(failed_dir)
+            if job_id in done_ids:
                 continue
 
-            claim_id = claim_job(state_dir / "queue", state_dir / "running", zip_path)
+            zip_path = input_dir / zip_name
+            claim_id = claim_job(queue_dir, running_dir, zip_path)
             if claim_id is not None:
                 _logger.info("[claim] Claimed job %s", claim_id)
                 if persistent_armed and persistent_trigger_path is not None:
                     mark_persistent_trigger_handled(persistent_trigger_path, state_dir)
-                claim_path = state_dir / "queue" / f"{claim_id}.claimed"
-                try:
-                    success = start_job(
-                        script_dir,
-                        nc_output_dir,
-                        task_prompt_file,
-                        state_dir,
-                        claim_id,
-                        zip_path,
-                        work_dir=work_dir,
-                        log_dir=log_dir,
-                        nc_log_dir=nc_log_dir,
-                        log_sync_seconds=log_sync_seconds,
-                        keep_work_dir=keep_work_dir,
-                        post_sync_hook_cmd=post_sync_hook_cmd,
-                        post_sync_hook_timeout_seconds=post_sync_hook_timeout_seconds,
-                        keep_failed_marker=keep_failed_marker,
-                    )
-                finally:
-                    claim_path.unlink(missing_ok=True)
-                if (not success) and stop_loop_on_job_failure:
-                    consume_start_trigger_if_needed(trigger_path, consume_trigger)
-                    _logger.error(
-                        "[loop] stopping due to job failure (STOP_LOOP_ON_JOB_FAILURE=1, job=%s)",
-                        claim_id,
-                    )
-                    raise SystemExit(1)
+                claim_path = queue_dir / f"{claim_id}.claimed"
+                fut = pool.submit(
+                    _run_claimed_job,
+                    claim_path,
+                    script_dir,
+                    nc_output_dir,
+                    task_prompt_file,
+                    state_dir,
+                    claim_id,
+                    zip_path,
+                    work_dir=work_dir,
+                    log_dir=log_dir,
+                    nc_log_dir=nc_log_dir,
+                    log_sync_seconds=log_sync_seconds,
+                    keep_work_dir=keep_work_dir,
+                    post_sync_hook_cmd=post_sync_hook_cmd,
+                    post_sync_hook_timeout_seconds=post_sync_hook_timeout_seconds,
+                    keep_failed_marker=keep_failed_marker,
+                    worker_env=worker_env,
+                )
+                in_flight[fut] = claim_id
+                fut.add_done_callback(lambda _fut: waiter.notify())
 
-        time.sleep(poll_seconds)
+        _idle(poll_seconds, waiter)
 
 
 if __name__ == "__main__":
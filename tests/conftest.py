@@ -1,10 +1,20 @@
 import logging
-import logging.handlers
+import os
 from pathlib import Path
 
 import pytest
 
 
+def pytest_configure(config: pytest.Config) -> None:
+    """Register the custom markers."""
+    config.addinivalue_line(
+        "markers", "integration: end-to-end start_job runs against a fake docker"
+    )
+    config.addinivalue_line(
+        "markers", "benchmark: pytest-benchmark regression gate (docker compose run --rm bench)"
+    )
+
+
 @pytest.fixture
 def job_dirs(tmp_path: Path) -> dict[str, Path]:
     """Work dir structure for a single job."""
@@ -15,8 +25,9 @@ def job_dirs(tmp_path: Path) -> dict[str, Path]:
         "tmp": tmp_path / "work" / "test-job" / "tmp",
         "logs": tmp_path / "work" / "test-job" / "tmp" / "logs",
     }
-    for d in dirs.values():
-        d.mkdir(parents=True, exist_ok=True)
+    # Leaves only; makedirs creates root and tmp on the way.
+    for key in ("input", "output", "logs"):
+        os.makedirs(dirs[key], exist_ok=True)
     return dirs
 
 
@@ -43,19 +54,20 @@ def state_dirs(tmp_path: Path) -> dict[str, Path]:
         "failed": base / "failed",
         "queue": base / "queue",
     }
-    for d in dirs.values():
-        d.mkdir(parents=True, exist_ok=True)
+    for key in ("running", "done", "failed", "queue"):
+        os.makedirs(dirs[key], exist_ok=True)
     return dirs
 
 
-@pytest.fixture
-def mock_job_logger() -> logging.Logger:
-    """Logger that writes to a MemoryHandler (no files)."""
-    logger = logging.getLogger(f"test-job-{id(object())}")
+@pytest.fixture(scope="module")
+def mock_job_logger(request: pytest.FixtureRequest) -> logging.Logger:
+    """Logger with a NullHandler (no files), shared by every test in a module.
+
+    No test inspects the records, so one logger per module is enough.
+    """
+    logger = logging.getLogger(f"test-job.{request.module.__name__}")
     logger.setLevel(logging.DEBUG)
-    handler = logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.CRITICAL)
+    handler = logging.NullHandler()
     logger.addHandler(handler)
     yield logger
-    for h in logger.handlers[:]:
-        h.close()
-        logger.removeHandler(h)
+    logger.removeHandler(handler)
@@ -0,0 +1,15 @@
+"""Small helpers shared by the test modules."""
+
+import os
+from pathlib import Path
+
+
+def wf(path: Path, data: str | bytes) -> None:
+    """Create or truncate a small fixture file with a single write(2)."""
+    if isinstance(data, str):
+        data = data.encode()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
@@ -1,11 +1,38 @@
 """Unit tests for helper functions in ralph_loop.py."""
 
+import concurrent.futures
+import errno
+import heapq
+import itertools
 import logging
+import os
+import time
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
-from ralph_loop import _format_elapsed, atomic_copy, write_nc_status, _cleanup_work_dir
+import ralph_loop
+from ralph_loop import (
+    WorkerEnv,
+    _adjust_running_count,
+    _cleanup_work_dir,
+    _close_job_logger,
+    _format_elapsed,
+    _make_job_logger,
+    _reap_jobs,
+    _sweep_removed_trees,
+    atomic_copy,
+    claim_job,
+    fast_copy,
+    find_latest_version_zip,
+    input_zip_heap,
+    list_input_zips,
+    load_env_file,
+    marker_ids,
+    running_jobs_count,
+    write_nc_status,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -32,8 +59,277 @@ def test_format_elapsed(seconds: int, expected: str) -> None:
 
 
 # ---------------------------------------------------------------------------
-# atomic_copy
+# job logger
+# ---------------------------------------------------------------------------
+
+
+def test_job_logger_close_releases_stream(tmp_path: Path) -> None:
+    (tmp_path / "jobs").mkdir()
+    jlog = _make_job_logger(tmp_path, "job1")
+    stream = jlog.handlers[0].target.stream
+    jlog.info("hello")
+
+    _close_job_logger(jlog)
+
+    assert stream.closed
+    assert jlog.handlers == []
+    assert (tmp_path / "jobs" / "job1.log").read_text().rstrip().endswith("hello")
+
+
+# ---------------------------------------------------------------------------
+# load_env_file
+# ---------------------------------------------------------------------------
+
+
+def test_load_env_file_parses_assignments(tmp_path: Path) -> None:
+    env_file = tmp_path / ".env"
+    env_file.write_text(
+        "\ufeffSTATE_DIR=/srv/state\n"
+        "# comment\n"
+        "\n"
+        "INPUT_DIR=/srv/in\n"
+        "export WORK_DIR=/srv/work\n"
+        "  POLL_SECONDS = 5  \r\n"
+        "EMPTY=\n"
+        "POST_SYNC_HOOK_CMD=occ files:scan --path=\"a b\"\n"
+        "  # INDENTED_COMMENT=1\n"
+        "not an assignment\n"
+        "KEEP=mine\n"
+    )
+    with patch.dict(os.environ, {"KEEP": "theirs"}, clear=True):
+        load_env_file(env_file)
+        assert dict(os.environ) == {
+            "STATE_DIR": "/srv/state",
+            "INPUT_DIR": "/srv/in",
+            "WORK_DIR": "/srv/work",
+            "POLL_SECONDS": "5",
+            "EMPTY": "",
+            "POST_SYNC_HOOK_CMD": 'occ files:scan --path="a b"',
+            "KEEP": "theirs",
+        }
+
+
+def test_load_env_file_skips_unchanged_file(tmp_path: Path) -> None:
+    env_file = tmp_path / ".env"
+    env_file.write_text("A=1\n")
+    os.utime(env_file, ns=(10**9, 10**9))
+    with patch.dict(os.environ, {}, clear=True):
+        load_env_file(env_file)
+        del os.environ["A"]
+        load_env_file(env_file)
+        assert "A" not in os.environ
+
+        os.utime(env_file, ns=(2 * 10**9, 2 * 10**9))
+        load_env_file(env_file)
+        assert os.environ["A"] == "1"
+
+
+def test_load_env_file_missing_is_noop(tmp_path: Path) -> None:
+    with patch.dict(os.environ, {}, clear=True):
+        load_env_file(tmp_path / "nope.env")
+        assert dict(os.environ) == {}
+
+
 # ---------------------------------------------------------------------------
+# list_input_zips
+# ---------------------------------------------------------------------------
+
+
+def test_list_input_zips_sorted_files_only(tmp_path: Path) -> None:
+    for name in ("b.zip", "a.zip", "notes.txt", "c.zip.part"):
+        (tmp_path / name).write_bytes(b"x")
+    (tmp_path / "dir.zip").mkdir()
+
+    assert list_input_zips(tmp_path) == ["a.zip", "b.zip"]
+
+
+def test_input_zip_heap_pops_in_sorted_order(tmp_path: Path) -> None:
+    for name in ("job3.zip", "job1.zip", "job2.zip", "notes.txt"):
+        (tmp_path / name).write_bytes(b"x")
+
+    heap = input_zip_heap(tmp_path)
+
+    assert [heapq.heappop(heap) for _ in range(len(heap))] == ["job1.zip", "job2.zip", "job3.zip"]
+
+
+# ---------------------------------------------------------------------------
+# WorkerEnv
+# ---------------------------------------------------------------------------
+
+
+def test_worker_env_from_environ_and_docker_args() -> None:
+    cfg = WorkerEnv.from_environ({"MAX_ITERATIONS": "3", "CLAUDE_ARGS": "--print --verbose", "UNRELATED": "x"})
+
+    assert cfg.max_iterations == "3"
+    assert cfg.max_seconds == "3600"
+    args = cfg.docker_env_args()
+    assert args[:2] == ("-e", "INPUT_ZIP=/job/input.zip")
+    assert args[6:10] == ("-e", "MAX_ITERATIONS=3", "-e", "MAX_SECONDS=3600")
+    assert "CLAUDE_ARGS=--print --verbose" in args
+    assert args[::2] == ("-e",) * 16
+    assert cfg.docker_env_args() is args
+
+
+# ---------------------------------------------------------------------------
+# find_latest_version_zip
+# ---------------------------------------------------------------------------
+
+
+def test_find_latest_version_zip_picks_highest(tmp_path: Path) -> None:
+    for name in ("job1_v1.zip", "job1_v10.zip", "job1_v2.zip", "job1_v3.partial.zip", "job1_vx.zip"):
+        (tmp_path / name).write_bytes(b"zip")
+    (tmp_path / "job12_v99.zip").write_bytes(b"other job")
+
+    assert find_latest_version_zip(tmp_path, "job1") == (tmp_path / "job1_v10.zip", 10)
+
+
+def test_find_latest_version_zip_cached_until_dir_changes(tmp_path: Path) -> None:
+    (tmp_path / "job1_v1.zip").write_bytes(b"zip")
+    os.utime(tmp_path, ns=(10**9, 10**9))
+    assert find_latest_version_zip(tmp_path, "job1") == (tmp_path / "job1_v1.zip", 1)
+
+    # Same directory mtime: the cached answer is returned without rescanning.
+    (tmp_path / "job1_v2.zip").write_bytes(b"zip")
+    os.utime(tmp_path, ns=(10**9, 10**9))
+    assert find_latest_version_zip(tmp_path, "job1") == (tmp_path / "job1_v1.zip", 1)
+
+    os.utime(tmp_path, ns=(2 * 10**9, 2 * 10**9))
+    assert find_latest_version_zip(tmp_path, "job1") == (tmp_path / "job1_v2.zip", 2)
+
+
+def test_find_latest_version_zip_none(tmp_path: Path) -> None:
+    (tmp_path / "job1.zip").write_bytes(b"zip")
+
+    assert find_latest_version_zip(tmp_path, "job1") == (None, 0)
+
+
+# ---------------------------------------------------------------------------
+# claim_job
+# ---------------------------------------------------------------------------
+
+
+def test_claim_job_is_exclusive_and_recovers_stale(tmp_path: Path) -> None:
+    queue = tmp_path / "queue"
+    running = tmp_path / "running"
+    queue.mkdir()
+    running.mkdir()
+    zip_path = tmp_path / "input" / "job1.zip"
+
+    assert claim_job(queue, running, zip_path) == "job1"
+    assert (queue / "job1.claimed").read_text() == str(zip_path)
+
+    # Claimed and running: second claim is refused.
+    (running / "job1").touch()
+    assert claim_job(queue, running, zip_path) is None
+
+    # Claimed but not running: the stale claim is replaced.
+    (running / "job1").unlink()
+    assert claim_job(queue, running, zip_path) == "job1"
+
+
+# ---------------------------------------------------------------------------
+# marker_ids
+# ---------------------------------------------------------------------------
+
+
+def test_marker_ids_cached_until_dir_changes(tmp_path: Path) -> None:
+    (tmp_path / "job1").touch()
+    os.utime(tmp_path, ns=(10**9, 10**9))
+    assert marker_ids(tmp_path) == {"job1"}
+
+    (tmp_path / "job2").touch()
+    os.utime(tmp_path, ns=(10**9, 10**9))
+    assert marker_ids(tmp_path) == {"job1"}
+
+    ralph_loop._forget_markers(tmp_path)
+    assert marker_ids(tmp_path) == {"job1", "job2"}
+
+
+# ---------------------------------------------------------------------------
+# running_jobs_count
+# ---------------------------------------------------------------------------
+
+
+def test_running_jobs_count_cached_between_reconciles(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(ralph_loop, "_running_scanned_at", float("-inf"))
+    monkeypatch.setattr(ralph_loop, "_running_count", 0)
+    (tmp_path / "job1").touch()
+    (tmp_path / "job2").touch()
+
+    assert running_jobs_count(tmp_path) == 2
+
+    # Served from memory: on-disk changes are not seen until the next reconcile
+    (tmp_path / "job3").touch()
+    _adjust_running_count(-1)
+    assert running_jobs_count(tmp_path) == 1
+
+    monkeypatch.setattr(ralph_loop, "_running_scanned_at", float("-inf"))
+    assert running_jobs_count(tmp_path) == 3
+
+
+# ---------------------------------------------------------------------------
+# _reap_jobs
+# ---------------------------------------------------------------------------
+
+
+def test_reap_jobs_collects_failures() -> None:
+    def future(result: object) -> concurrent.futures.Future:
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        if isinstance(result, BaseException):
+            fut.set_exception(result)
+        else:
+            fut.set_result(result)
+        return fut
+
+    pending: concurrent.futures.Future = concurrent.futures.Future()
+    in_flight = {
+        future(True): "ok",
+        future(False): "failed",
+        future(RuntimeError("boom")): "crashed",
+        pending: "running",
+    }
+
+    assert sorted(_reap_jobs(in_flight)) == ["crashed", "failed"]
+    assert in_flight == {pending: "running"}
+
+
+# ---------------------------------------------------------------------------
+# fast_copy / atomic_copy
+# ---------------------------------------------------------------------------
+
+
+def test_fast_copy_preserves_data_and_metadata(tmp_path: Path) -> None:
+    src = tmp_path / "input.zip"
+    src.write_bytes(b"PK\x03\x04" + bytes(range(256)) * 1024)
+    os.chmod(src, 0o640)
+    os.utime(src, (1_000_000_000, 1_000_000_000))
+    dst = tmp_path / "copy.zip"
+
+    fast_copy(src, dst)
+
+    assert dst.read_bytes() == src.read_bytes()
+    assert dst.stat().st_mtime == src.stat().st_mtime
+    assert dst.stat().st_mode & 0o777 == 0o640
+
+
+def test_atomic_copy_short_copy_raises(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A copy that comes up short is an error, and the destination is never renamed in."""
+    src = tmp_path / "out.zip"
+    src.write_bytes(b"0123456789")
+    dst = tmp_path / "nc" / "out.zip"
+
+    def no_reflink(*args):
+        raise OSError(errno.EOPNOTSUPP, "no reflink")
+
+    monkeypatch.setattr(ralph_loop.fcntl, "ioctl", no_reflink)
+    monkeypatch.setattr(ralph_loop, "_copy_range", lambda src_fd, dst_fd, offset, count: os.write(dst_fd, b"01"))
+
+    with pytest.raises(OSError, match="short copy"):
+        atomic_copy(src, dst)
+
+    assert list(dst.parent.iterdir()) == []
 
 
 def test_atomic_copy_basic(tmp_path: Path) -> None:
@@ -136,3 +432,81 @@ class TestCleanupWorkDir:
         work = _make_work_dir(tmp_path)
         _cleanup_work_dir(work, success=False, keep_work_dir="on_failure", jlog=mock_job_logger)
         assert work.exists()
+
+    def test_removed_tree_is_deleted_in_background(
+        self, tmp_path: Path, mock_job_logger: logging.Logger
+    ) -> None:
+        work = _make_work_dir(tmp_path)
+        _cleanup_work_dir(work, success=True, keep_work_dir="never", jlog=mock_job_logger)
+        assert not work.exists()
+
+        deadline = time.monotonic() + 5
+        while any(work.parent.iterdir()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert list(work.parent.iterdir()) == []
+
+    def test_sweep_removed_trees(self, tmp_path: Path) -> None:
+        """Trash left behind by a process that died mid-delete is collected."""
+        trash = tmp_path / ".job.deleting-1-2"
+        (trash / "output").mkdir(parents=True)
+        (tmp_path / "job2").mkdir()
+
+        assert _sweep_removed_trees(tmp_path) == 1
+
+        deadline = time.monotonic() + 5
+        while trash.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [p.name for p in tmp_path.iterdir()] == ["job2"]
+
+
+# ---------------------------------------------------------------------------
+# main loop
+# ---------------------------------------------------------------------------
+
+
+def test_failed_job_not_relaunched_before_poll_interval(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A failing job wakes the loop, but is retried at most once per poll interval."""
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "job.zip").write_bytes(b"PK\x03\x04")
+    for name, rel in (
+        ("INPUT_DIR", "input"),
+        ("OUTPUT_DIR", "output"),
+        ("STATE_DIR", ".state"),
+        ("WORK_DIR", "work"),
+        ("LOG_DIR", "logs"),
+        ("TASK_PROMPT_FILE", "task_prompt.txt"),
+        ("ENV_FILE", "missing.env"),
+    ):
+        monkeypatch.setenv(name, str(tmp_path / rel))
+    monkeypatch.setenv("KEEP_FAILED_MARKER", "0")
+    monkeypatch.setenv("POLL_SECONDS", "60")
+    for name in ("START_TRIGGER_FILE", "PERSISTENT_TRIGGER_FILE", "NEXTCLOUD_LOG_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+    calls: list[str] = []
+
+    def failing_job(*args, **kwargs) -> bool:
+        calls.append(args[4])
+        return False
+
+    class Stop(Exception):
+        pass
+
+    idles = itertools.count()
+
+    def fast_idle(seconds: int, waiter=None) -> None:
+        if next(idles) >= 50:
+            raise Stop
+        time.sleep(0.001)
+
+    monkeypatch.setattr(ralph_loop, "setup_logging", lambda log_dir: None)
+    monkeypatch.setattr(ralph_loop, "start_job", failing_job)
+    monkeypatch.setattr(ralph_loop, "_idle", fast_idle)
+
+    with pytest.raises(Stop):
+        ralph_loop.main()
+
+    assert calls == ["job"]
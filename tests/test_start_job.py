@@ -1,40 +1,66 @@
 """Integration tests for start_job using a FakePopen."""
 
+import itertools
+import os
+import subprocess
 import time
 from pathlib import Path
-from unittest.mock import patch, MagicMock
 
 import pytest
 
+import ralph_loop
 from ralph_loop import start_job
 
+pytestmark = pytest.mark.integration
+
+_INPUT_ZIP = b"PK\x03\x04fake-zip-data"
+_OUT_ZIP = b"PK\x03\x04fake"
+_ITER_LOG = "iteration 1 output\n"
+_PROMPT = "do the thing\n"
+_STATES = ("running", "done", "failed", "queue")
+
+
+@pytest.fixture(autouse=True)
+def _no_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    """start_job falls back to time.sleep between polls; never really sleep here."""
+    monkeypatch.setattr(time, "sleep", lambda *args, **kwargs: None)
+
 
 class FakePopen:
     """
     Simulates subprocess.Popen for a docker container.
 
-    On construction: writes iter-1.log into the work dir's tmp/logs/.
-    poll() returns None twice, then 0 (or the configured return code).
+    poll() returns None twice, then 0 (or the configured return code); just
+    before the first non-None result it writes iter-1.log into the work
+    dir's tmp/logs/ (and, if out_zip is set, that zip into output/), like a
+    container finishing its only iteration.
     """
 
-    def __init__(self, rc: int, work_logs_dir: Path, output_dir: Path):
-        self._rc = rc
-        self._poll_count = 0
+    def __init__(
+        self, rc: int, work_logs_dir: Path, output_dir: Path, out_zip: str | None = None
+    ):
+        self._poll_results = (None, None, rc)
+        self._idx = 0
         self.pid = 12345
         self.returncode: int | None = None
         self._work_logs_dir = work_logs_dir
         self._output_dir = output_dir
-
-        # Simulate container writing log files
-        self._work_logs_dir.mkdir(parents=True, exist_ok=True)
-        (self._work_logs_dir / "iter-1.log").write_text("iteration 1 output\n")
+        self._out_zip = out_zip
+        self._written = False
 
     def poll(self) -> int | None:
-        self._poll_count += 1
-        if self._poll_count <= 2:
-            return None
-        self.returncode = self._rc
-        return self._rc
+        r = self._poll_results[min(self._idx, 2)]
+        self._idx += 1
+        if r is not None:
+            if not self._written:
+                self._work_logs_dir.mkdir(parents=True, exist_ok=True)
+                (self._work_logs_dir / "iter-1.log").write_text(_ITER_LOG)
+                if self._out_zip:
+                    self._output_dir.mkdir(parents=True, exist_ok=True)
+                    (self._output_dir / self._out_zip).write_bytes(_OUT_ZIP)
+                self._written = True
+            self.returncode = r
+        return r
 
 
 def _make_fake_popen(rc: int, job_id: str, work_dir: Path, create_zip: bool = False):
@@ -42,217 +68,220 @@ def _make_fake_popen(rc: int, job_id: str, work_dir: Path, create_zip: bool = Fa
     logs_dir = work_dir / job_id / "tmp" / "logs"
     output_dir = work_dir / job_id / "output"
 
+    # start_job only syncs what the container leaves in output/, so the
+    # success case still needs the fake to produce a zip.
+    out_zip = f"{job_id}_v1.zip" if create_zip else None
+
     def factory(cmd, **kwargs):
-        fake = FakePopen(rc, logs_dir, output_dir)
-        if create_zip:
-            output_dir.mkdir(parents=True, exist_ok=True)
-            (output_dir / f"{job_id}_v1.zip").write_bytes(b"PK\x03\x04fake")
-        return fake
+        return FakePopen(rc, logs_dir, output_dir, out_zip)
 
     return factory
 
 
-@pytest.fixture
-def integration_dirs(tmp_path: Path) -> dict[str, Path]:
-    """Set up all dirs needed by start_job."""
-    dirs = {
-        "script_dir": tmp_path / "script",
-        "nc_output": tmp_path / "nc" / "output",
-        "nc_logs": tmp_path / "nc" / "logs",
-        "state": tmp_path / ".state",
-        "work": tmp_path / "work",
-        "log": tmp_path / "logs",
-    }
-    for d in dirs.values():
-        d.mkdir(parents=True, exist_ok=True)
-
-    # State subdirs
-    for sub in ("running", "done", "failed", "queue"):
-        (dirs["state"] / sub).mkdir(parents=True, exist_ok=True)
-
-    # Job log subdir
-    (dirs["log"] / "jobs").mkdir(parents=True, exist_ok=True)
+@pytest.fixture(scope="session")
+def _integration_template(tmp_path_factory: pytest.TempPathFactory) -> dict[str, Path]:
+    """Read-only inputs shared by every start_job test (built once per session)."""
+    root = tmp_path_factory.mktemp("integration-template")
 
-    # Task prompt
-    prompt = dirs["script_dir"] / "task_prompt.txt"
-    prompt.write_text("do the thing\n")
-    dirs["task_prompt"] = prompt
+    script_dir = root / "script"
+    script_dir.mkdir()
+    prompt = script_dir / "task_prompt.txt"
+    prompt.write_text(_PROMPT)
 
-    # Input zip
-    input_dir = tmp_path / "input"
+    input_dir = root / "input"
     input_dir.mkdir()
     zip_path = input_dir / "testjob.zip"
-    zip_path.write_bytes(b"PK\x03\x04fake-zip-data")
-    dirs["zip"] = zip_path
+    zip_path.write_bytes(_INPUT_ZIP)
 
+    return {"script_dir": script_dir, "task_prompt": prompt, "zip": zip_path}
+
+
+# Leaf directories start_job writes to; os.makedirs creates their parents.
+_MUTABLE_DIRS = (
+    "nc/output",
+    "nc/logs",
+    *(f".state/{state}" for state in _STATES),
+    "work",
+    "logs/jobs",
+)
+
+
+def _make_integration_dirs(root: Path, template: dict[str, Path]) -> dict[str, Path]:
+    for rel in _MUTABLE_DIRS:
+        os.makedirs(root / rel, exist_ok=True)
+    dirs = {
+        "nc_output": root / "nc" / "output",
+        "nc_logs": root / "nc" / "logs",
+        "state": root / ".state",
+        "work": root / "work",
+        "log": root / "logs",
+    }
+    dirs.update(template)
     return dirs
 
 
-class TestStartJobSuccess:
-    @patch("time.sleep")
-    @patch("subprocess.Popen")
-    def test_success_flow(
-        self,
-        mock_popen: MagicMock,
-        mock_sleep: MagicMock,
-        integration_dirs: dict[str, Path],
-    ) -> None:
-        d = integration_dirs
-        job_id = "testjob"
-
-        mock_popen.side_effect = _make_fake_popen(
-            rc=0, job_id=job_id, work_dir=d["work"], create_zip=True
-        )
+@pytest.fixture
+def integration_dirs(tmp_path: Path, _integration_template: dict[str, Path]) -> dict[str, Path]:
+    """Set up all dirs needed by start_job.
 
-        start_job(
-            script_dir=d["script_dir"],
-            nc_output_dir=d["nc_output"],
-            task_prompt_file=d["task_prompt"],
-            state_dir=d["state"],
-            job_id=job_id,
-            zip_path=d["zip"],
-            work_dir=d["work"],
-            log_dir=d["log"],
-            nc_log_dir=d["nc_logs"],
-            log_sync_seconds=0,
-            keep_work_dir="on_failure",
+    start_job only reads the script dir, prompt and input zip, so those come
+    from the session template; only the dirs it writes to are per-test.
+    """
+    return _make_integration_dirs(tmp_path, _integration_template)
+
+
+def _start_job_kwargs(d: dict[str, Path], job_id: str, **overrides) -> dict:
+    kwargs = dict(
+        script_dir=d["script_dir"],
+        nc_output_dir=d["nc_output"],
+        task_prompt_file=d["task_prompt"],
+        state_dir=d["state"],
+        job_id=job_id,
+        zip_path=d["zip"],
+        work_dir=d["work"],
+        log_dir=d["log"],
+        nc_log_dir=d["nc_logs"],
+        log_sync_seconds=0,
+        keep_work_dir="on_failure",
+        post_sync_hook_cmd="",
+        post_sync_hook_timeout_seconds=10,
+        keep_failed_marker=True,
+    )
+    kwargs.update(overrides)
+    return kwargs
+
+
+@pytest.mark.parametrize(
+    "rc, keep, nc_log, create_zip, exp_state",
+    [
+        (0, "on_failure", True, True, "done"),
+        (1, "on_failure", True, False, "failed"),
+        (0, "always", True, False, "done"),
+        (0, "on_failure", False, False, "done"),
+    ],
+    ids=["success", "failure", "keep-always", "no-nc-log-dir"],
+)
+def test_start_job(
+    monkeypatch: pytest.MonkeyPatch,
+    rc: int,
+    keep: str,
+    nc_log: bool,
+    create_zip: bool,
+    exp_state: str,
+    integration_dirs: dict[str, Path],
+) -> None:
+    d = integration_dirs
+    job_id = "testjob"
+
+    monkeypatch.setattr(
+        subprocess,
+        "Popen",
+        _make_fake_popen(rc=rc, job_id=job_id, work_dir=d["work"], create_zip=create_zip),
+    )
+
+    start_job(
+        **_start_job_kwargs(
+            d, job_id, nc_log_dir=d["nc_logs"] if nc_log else None, keep_work_dir=keep
         )
+    )
+
+    # State markers: running removed, exactly one final marker created
+    markers = {state: set(os.listdir(d["state"] / state)) for state in _STATES[:3]}
+    assert markers == {
+        "running": set(),
+        "done": {job_id} if exp_state == "done" else set(),
+        "failed": {job_id} if exp_state == "failed" else set(),
+    }
 
+    if nc_log:
+        # Combined log and status file written
+        assert set(os.listdir(d["nc_logs"])) == {f"{job_id}.log", f"{job_id}.status"}
+        nc_status = d["nc_logs"] / f"{job_id}.status"
+        assert exp_state in nc_status.read_text()
+
+    # Work dir kept on failure (on_failure mode) or always; cleaned up otherwise
+    kept = keep == "always" or exp_state == "failed"
+    assert (job_id in os.listdir(d["work"])) == kept
+
+    if create_zip:
         # Combined log synced to nc_log_dir
-        nc_log = d["nc_logs"] / f"{job_id}.log"
-        assert nc_log.exists()
-        log_content = nc_log.read_text()
+        log_content = (d["nc_logs"] / f"{job_id}.log").read_text()
         assert "Iteration 1" in log_content
-        assert "iteration 1 output" in log_content
-
-        # Status file written
-        nc_status = d["nc_logs"] / f"{job_id}.status"
-        assert nc_status.exists()
-        assert "done" in nc_status.read_text()
+        assert _ITER_LOG in log_content
 
         # Output zip synced
-        assert (d["nc_output"] / f"{job_id}_v1.zip").exists()
-
-        # State markers: running removed, done created
-        assert not (d["state"] / "running" / job_id).exists()
-        assert (d["state"] / "done" / job_id).exists()
-        assert not (d["state"] / "failed" / job_id).exists()
-
-        # Work dir cleaned up on success (on_failure mode)
-        assert not (d["work"] / job_id).exists()
-
-        # time.sleep was called (not real sleep due to mock)
-        assert mock_sleep.called
-
-
-class TestStartJobFailure:
-    @patch("time.sleep")
-    @patch("subprocess.Popen")
-    def test_failure_flow(
-        self,
-        mock_popen: MagicMock,
-        mock_sleep: MagicMock,
-        integration_dirs: dict[str, Path],
-    ) -> None:
-        d = integration_dirs
-        job_id = "testjob"
-
-        mock_popen.side_effect = _make_fake_popen(
-            rc=1, job_id=job_id, work_dir=d["work"]
-        )
+        assert f"{job_id}_v1.zip" in os.listdir(d["nc_output"])
 
-        start_job(
-            script_dir=d["script_dir"],
-            nc_output_dir=d["nc_output"],
-            task_prompt_file=d["task_prompt"],
-            state_dir=d["state"],
-            job_id=job_id,
-            zip_path=d["zip"],
-            work_dir=d["work"],
-            log_dir=d["log"],
-            nc_log_dir=d["nc_logs"],
-            log_sync_seconds=0,
-            keep_work_dir="on_failure",
-        )
+        # Buffered job log is flushed to disk when the job ends
+        job_log = (d["log"] / "jobs" / f"{job_id}.log").read_text()
+        assert "Container exited (rc=0" in job_log
+        assert f"Job {job_id} completed" in job_log
 
-        # State markers: running removed, failed created
-        assert not (d["state"] / "running" / job_id).exists()
-        assert not (d["state"] / "done" / job_id).exists()
-        assert (d["state"] / "failed" / job_id).exists()
 
-        # Status file indicates failure
-        nc_status = d["nc_logs"] / f"{job_id}.status"
-        assert nc_status.exists()
-        assert "failed" in nc_status.read_text()
-
-        # Work dir kept (on_failure mode + failure)
-        assert (d["work"] / job_id).exists()
-
-
-class TestStartJobKeepAlways:
-    @patch("time.sleep")
-    @patch("subprocess.Popen")
-    def test_keep_always(
-        self,
-        mock_popen: MagicMock,
-        mock_sleep: MagicMock,
-        integration_dirs: dict[str, Path],
-    ) -> None:
-        d = integration_dirs
-        job_id = "testjob"
-
-        mock_popen.side_effect = _make_fake_popen(
-            rc=0, job_id=job_id, work_dir=d["work"]
-        )
+@pytest.mark.benchmark
+def test_success_flow_perf(
+    request: pytest.FixtureRequest,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    _integration_template: dict[str, Path],
+) -> None:
+    """Wall-time benchmark of a successful start_job run (needs pytest-benchmark).
 
-        start_job(
-            script_dir=d["script_dir"],
-            nc_output_dir=d["nc_output"],
-            task_prompt_file=d["task_prompt"],
-            state_dir=d["state"],
-            job_id=job_id,
-            zip_path=d["zip"],
-            work_dir=d["work"],
-            log_dir=d["log"],
-            nc_log_dir=d["nc_logs"],
-            log_sync_seconds=0,
-            keep_work_dir="always",
+    Runs as a regression gate in the ``bench`` compose service, which runs
+    without xdist and compares against the last saved run.
+    """
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    job_id = "benchjob"
+    rounds = itertools.count()
+
+    def setup():
+        # Each round needs untouched state/work dirs: start_job moves markers.
+        d = _make_integration_dirs(tmp_path / str(next(rounds)), _integration_template)
+        monkeypatch.setattr(
+            subprocess, "Popen", _make_fake_popen(0, job_id, d["work"], create_zip=True)
         )
+        return (), _start_job_kwargs(d, job_id)
 
-        # Work dir kept even on success
-        assert (d["work"] / job_id).exists()
-        assert (d["state"] / "done" / job_id).exists()
-
-
-class TestStartJobNoNcLogDir:
-    @patch("time.sleep")
-    @patch("subprocess.Popen")
-    def test_no_nc_log_dir(
-        self,
-        mock_popen: MagicMock,
-        mock_sleep: MagicMock,
-        integration_dirs: dict[str, Path],
-    ) -> None:
-        """start_job works fine when nc_log_dir is None."""
-        d = integration_dirs
-        job_id = "testjob"
-
-        mock_popen.side_effect = _make_fake_popen(
-            rc=0, job_id=job_id, work_dir=d["work"]
-        )
+    benchmark.pedantic(start_job, setup=setup, rounds=20)
 
-        start_job(
-            script_dir=d["script_dir"],
-            nc_output_dir=d["nc_output"],
-            task_prompt_file=d["task_prompt"],
-            state_dir=d["state"],
-            job_id=job_id,
-            zip_path=d["zip"],
-            work_dir=d["work"],
-            log_dir=d["log"],
-            nc_log_dir=None,
-            log_sync_seconds=0,
-            keep_work_dir="on_failure",
-        )
 
-        assert (d["state"] / "done" / job_id).exists()
+def test_start_job_popen_failure_marks_failed(
+    monkeypatch: pytest.MonkeyPatch, integration_dirs: dict[str, Path]
+) -> None:
+    d = integration_dirs
+    job_id = "testjob"
+
+    def broken_popen(cmd, **kwargs):
+        raise FileNotFoundError("docker")
+
+    monkeypatch.setattr(subprocess, "Popen", broken_popen)
+    monkeypatch.setattr(ralph_loop, "_running_count", 2)
+
+    with pytest.raises(FileNotFoundError):
+        start_job(**_start_job_kwargs(d, job_id))
+
+    assert os.listdir(d["state"] / "running") == []
+    assert os.listdir(d["state"] / "failed") == [job_id]
+    assert ralph_loop._running_count == 2
+
+
+def test_start_job_periodic_full_rescan(
+    monkeypatch: pytest.MonkeyPatch, integration_dirs: dict[str, Path]
+) -> None:
+    """Output is rescanned in full even when inotify reports nothing."""
+    d = integration_dirs
+    job_id = "testjob"
+    monkeypatch.setattr(subprocess, "Popen", _make_fake_popen(0, job_id, d["work"], create_zip=True))
+    monkeypatch.setattr(ralph_loop.DirWatcher, "read_events", lambda self: [])
+    monkeypatch.setattr(ralph_loop, "WATCH_RESCAN_SECONDS", 0)
+    calls = []
+    real_sync = ralph_loop.sync_output_dir
+    monkeypatch.setattr(
+        ralph_loop, "sync_output_dir", lambda *args: calls.append(args[4:]) or real_sync(*args)
+    )
+
+    assert start_job(**_start_job_kwargs(d, job_id))
+
+    # Two full rescans from the poll loop, then the final sync.
+    assert calls == [(None,), (None,), ()]
@@ -1,9 +1,30 @@
 """Unit tests for sync functions in ralph_loop.py."""
 
+import contextlib
+import errno
 import logging
+import os
+import re
+import time
+from collections.abc import Iterator
 from pathlib import Path
 
-from ralph_loop import sync_iter_logs, sync_output_zips, sync_output_status_files
+import pytest
+
+from ralph_loop import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_MODIFY,
+    IN_MOVED_TO,
+    DirWatcher,
+    LoopWaiter,
+    _copy_range,
+    open_combined_log,
+    run_post_sync_hook,
+    sync_iter_logs,
+    sync_output_dir,
+)
+from tests.helpers import wf
 
 
 # ---------------------------------------------------------------------------
@@ -11,31 +32,44 @@ from ralph_loop import sync_iter_logs, sync_output_zips, sync_output_status_file
 # ---------------------------------------------------------------------------
 
 
+@contextlib.contextmanager
+def combined_log(path: Path) -> Iterator[int]:
+    fd = open_combined_log(path)
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
 class TestSyncIterLogs:
+    @pytest.fixture
+    def ctx(self, tmp_path: Path) -> tuple[Path, Path, dict[str, int]]:
+        """(work logs dir, combined log path, offsets) for one sync run."""
+        logs_dir = tmp_path / "logs"
+        logs_dir.mkdir()
+        return logs_dir, tmp_path / "nc" / "combined.log", {}
+
     def test_no_logs_dir_is_noop(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, tmp_path: Path, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
     ) -> None:
         """When work_logs_dir doesn't exist, nothing happens."""
-        nc_log = tmp_path / "nc" / "combined.log"
-        offsets: dict[str, int] = {}
+        _, nc_log, offsets = ctx
 
-        sync_iter_logs(tmp_path / "nonexistent", nc_log, offsets, mock_job_logger)
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(tmp_path / "nonexistent", fd, offsets, mock_job_logger)
 
-        assert not nc_log.exists()
+        assert nc_log.read_text() == ""
         assert offsets == {}
 
     def test_single_iter_log(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
     ) -> None:
         """A single iter-1.log produces a combined file with header + content."""
-        logs_dir = tmp_path / "logs"
-        logs_dir.mkdir()
-        (logs_dir / "iter-1.log").write_text("line one\nline two\n")
-
-        nc_log = tmp_path / "nc" / "combined.log"
-        offsets: dict[str, int] = {}
+        logs_dir, nc_log, offsets = ctx
+        wf(logs_dir / "iter-1.log", "line one\nline two\n")
 
-        sync_iter_logs(logs_dir, nc_log, offsets, mock_job_logger)
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger)
 
         content = nc_log.read_text()
         assert "=== Iteration 1 started" in content
@@ -43,27 +77,23 @@ class TestSyncIterLogs:
         assert offsets["iter-1.log"] == len("line one\nline two\n")
 
     def test_incremental_append(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
     ) -> None:
         """Only new bytes are appended on subsequent calls."""
-        logs_dir = tmp_path / "logs"
-        logs_dir.mkdir()
-
+        logs_dir, nc_log, offsets = ctx
         iter_file = logs_dir / "iter-1.log"
-        iter_file.write_text("chunk1\n")
+        wf(iter_file, "chunk1\n")
 
-        nc_log = tmp_path / "nc" / "combined.log"
-        offsets: dict[str, int] = {}
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger)
+            first_content = nc_log.read_text()
 
-        sync_iter_logs(logs_dir, nc_log, offsets, mock_job_logger)
-        first_content = nc_log.read_text()
+            # Append more data
+            with iter_file.open("a") as f:
+                f.write("chunk2\n")
 
-        # Append more data
-        with iter_file.open("a") as f:
-            f.write("chunk2\n")
-
-        sync_iter_logs(logs_dir, nc_log, offsets, mock_job_logger)
-        second_content = nc_log.read_text()
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger)
+            second_content = nc_log.read_text()
 
         # Header should appear once, chunk2 appended
         assert second_content.count("=== Iteration 1") == 1
@@ -72,19 +102,16 @@ class TestSyncIterLogs:
         assert len(second_content) > len(first_content)
 
     def test_multiple_files_sorted(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
     ) -> None:
         """Multiple iter files are processed in sorted order, each with a header."""
-        logs_dir = tmp_path / "logs"
-        logs_dir.mkdir()
-        (logs_dir / "iter-2.log").write_text("second\n")
-        (logs_dir / "iter-1.log").write_text("first\n")
-        (logs_dir / "iter-10.log").write_text("tenth\n")
-
-        nc_log = tmp_path / "nc" / "combined.log"
-        offsets: dict[str, int] = {}
+        logs_dir, nc_log, offsets = ctx
+        wf(logs_dir / "iter-2.log", "second\n")
+        wf(logs_dir / "iter-1.log", "first\n")
+        wf(logs_dir / "iter-10.log", "tenth\n")
 
-        sync_iter_logs(logs_dir, nc_log, offsets, mock_job_logger)
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger)
 
         content = nc_log.read_text()
         # All three headers present
@@ -93,124 +120,335 @@ class TestSyncIterLogs:
         assert "=== Iteration 10 " in content
 
         # Sorted order: iter-1, iter-10, iter-2 (lexicographic glob sort)
-        pos_1 = content.index("Iteration 1 ")
-        pos_10 = content.index("Iteration 10 ")
-        pos_2 = content.index("Iteration 2 ")
-        assert pos_1 < pos_10 < pos_2
+        hits = {m.group(1): m.start() for m in re.finditer(r"=== Iteration (\d+) ", content)}
+        assert hits["1"] < hits["10"] < hits["2"]
+
+    def test_stable_files_not_restated(
+        self, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
+    ) -> None:
+        """Fully synced, old files join the stable set and are skipped."""
+        logs_dir, nc_log, offsets = ctx
+        old_file = logs_dir / "iter-1.log"
+        wf(old_file, "done\n")
+        os.utime(old_file, (0, 0))
+        wf(logs_dir / "iter-2.log", "live\n")
+        stable: set[str] = set()
+
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger, stable=stable, stable_after=30)
+            assert stable == set()  # not yet fully synced before this pass
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger, stable=stable, stable_after=30)
+            assert stable == {"iter-1.log"}
+
+            # Appends to a stable file are ignored until the caller resets it.
+            with old_file.open("a") as f:
+                f.write("late\n")
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger, stable=stable, stable_after=30)
+            assert "late" not in nc_log.read_text()
+            stable.discard("iter-1.log")
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger, stable=stable, stable_after=30)
+
+        assert nc_log.read_text().endswith("late\n")
+
+    def test_reopened_log_appends(
+        self, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
+    ) -> None:
+        """Reopening the combined log (e.g. after an error) continues at EOF."""
+        logs_dir, nc_log, offsets = ctx
+        nc_log.parent.mkdir()
+        wf(nc_log, "previous run\n")
+        wf(logs_dir / "iter-1.log", "new\n")
+
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger)
+
+        content = nc_log.read_text()
+        assert content.startswith("previous run\n")
+        assert content.endswith("new\n")
 
     def test_empty_log_no_crash(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, ctx: tuple[Path, Path, dict[str, int]], mock_job_logger: logging.Logger
     ) -> None:
         """An empty iter log file doesn't cause errors (size=0, offset=0 → skip)."""
-        logs_dir = tmp_path / "logs"
-        logs_dir.mkdir()
-        (logs_dir / "iter-1.log").write_text("")
+        logs_dir, nc_log, offsets = ctx
+        wf(logs_dir / "iter-1.log", "")
 
-        nc_log = tmp_path / "nc" / "combined.log"
-        offsets: dict[str, int] = {}
-
-        sync_iter_logs(logs_dir, nc_log, offsets, mock_job_logger)
+        with combined_log(nc_log) as fd:
+            sync_iter_logs(logs_dir, fd, offsets, mock_job_logger)
 
         # Empty file → size <= offset (0 <= 0), skipped entirely
-        assert not nc_log.exists() or nc_log.read_text() == ""
+        assert nc_log.read_text() == ""
+
+
+@pytest.mark.parametrize("broken", [(), ("copy_file_range",), ("copy_file_range", "sendfile")])
+def test_copy_range_fallbacks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, broken: tuple[str, ...]
+) -> None:
+    """The requested byte range lands at the destination offset on every fallback path."""
+
+    def refuse(*args, **kwargs):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    for name in broken:
+        monkeypatch.setattr(os, name, refuse)
+
+    src = tmp_path / "src.log"
+    wf(src, b"0123456789")
+    dst = tmp_path / "dst.log"
+    wf(dst, b"head:")
+
+    src_fd = os.open(src, os.O_RDONLY)
+    dst_fd = os.open(dst, os.O_WRONLY)
+    try:
+        os.lseek(dst_fd, 0, os.SEEK_END)
+        _copy_range(src_fd, dst_fd, 3, 5)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+
+    assert dst.read_bytes() == b"head:34567"
+
+
+@pytest.mark.parametrize("zero", [("copy_file_range",), ("copy_file_range", "sendfile")])
+def test_copy_range_zero_return_falls_back(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, zero: tuple[str, ...]
+) -> None:
+    """A 0 return before EOF (FUSE/CIFS) moves on to the next method instead of truncating."""
+    for name in zero:
+        monkeypatch.setattr(os, name, lambda *args, **kwargs: 0)
+
+    src = tmp_path / "src.log"
+    wf(src, b"0123456789")
+    dst = tmp_path / "dst.log"
+    wf(dst, b"")
+
+    src_fd = os.open(src, os.O_RDONLY)
+    dst_fd = os.open(dst, os.O_WRONLY)
+    try:
+        _copy_range(src_fd, dst_fd, 2, 8)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+
+    assert dst.read_bytes() == b"23456789"
 
 
 # ---------------------------------------------------------------------------
-# sync_output_zips
+# sync_output_dir
 # ---------------------------------------------------------------------------
 
 
+@pytest.fixture
+def out_ctx(tmp_path: Path) -> tuple[Path, Path, set[str]]:
+    """(local output dir, Nextcloud output dir, synced zip names)."""
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    nc_out = tmp_path / "nc" / "output"
+    nc_out.mkdir(parents=True)
+    return output_dir, nc_out, set()
+
+
 class TestSyncOutputZips:
     def test_skips_partial_zip(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
     ) -> None:
         """Files ending in .partial.zip are ignored."""
-        output_dir = tmp_path / "output"
-        output_dir.mkdir()
-        (output_dir / "job1_v1.partial.zip").write_bytes(b"incomplete")
-
-        nc_out = tmp_path / "nc" / "output"
-        nc_out.mkdir(parents=True)
-        synced: set[str] = set()
+        output_dir, nc_out, synced = out_ctx
+        wf(output_dir / "job1_v1.partial.zip", b"incomplete")
 
-        sync_output_zips(output_dir, nc_out, synced, mock_job_logger)
+        sync_output_dir(output_dir, nc_out, synced, mock_job_logger)
 
         assert synced == set()
         assert not (nc_out / "job1_v1.partial.zip").exists()
 
     def test_skips_already_synced(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
     ) -> None:
         """Already-synced zip names are not copied again."""
-        output_dir = tmp_path / "output"
-        output_dir.mkdir()
-        (output_dir / "job1_v1.zip").write_bytes(b"data")
-
-        nc_out = tmp_path / "nc" / "output"
-        nc_out.mkdir(parents=True)
-        synced: set[str] = {"job1_v1.zip"}
+        output_dir, nc_out, synced = out_ctx
+        wf(output_dir / "job1_v1.zip", b"data")
+        synced.add("job1_v1.zip")
 
-        sync_output_zips(output_dir, nc_out, synced, mock_job_logger)
+        sync_output_dir(output_dir, nc_out, synced, mock_job_logger)
 
         # Not copied because already in synced set
         assert not (nc_out / "job1_v1.zip").exists()
 
     def test_copies_new_zip(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
     ) -> None:
         """New .zip files are copied and added to the synced set."""
-        output_dir = tmp_path / "output"
-        output_dir.mkdir()
-        (output_dir / "job1_v1.zip").write_bytes(b"zipdata")
+        output_dir, nc_out, synced = out_ctx
+        wf(output_dir / "job1_v1.zip", b"zipdata")
 
-        nc_out = tmp_path / "nc" / "output"
-        nc_out.mkdir(parents=True)
-        synced: set[str] = set()
-
-        sync_output_zips(output_dir, nc_out, synced, mock_job_logger)
+        sync_output_dir(output_dir, nc_out, synced, mock_job_logger)
 
         assert (nc_out / "job1_v1.zip").read_bytes() == b"zipdata"
         assert "job1_v1.zip" in synced
 
+    def test_only_named_files_when_names_given(
+        self, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
+    ) -> None:
+        """With a names list (from the watcher) no directory listing happens."""
+        output_dir, nc_out, synced = out_ctx
+        wf(output_dir / "job1_v1.zip", b"v1")
+        wf(output_dir / "job1_v2.zip", b"v2")
+
+        sync_output_dir(
+            output_dir, nc_out, synced, mock_job_logger, ["job1_v2.zip", "job1_v2.zip", "gone.zip"]
+        )
+
+        assert synced == {"job1_v2.zip"}
+        assert sorted(p.name for p in nc_out.iterdir()) == ["job1_v2.zip"]
+
+    def test_zips_and_status_in_one_pass(
+        self, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
+    ) -> None:
+        output_dir, nc_out, synced = out_ctx
+        wf(output_dir / "job1_v1.zip", b"zip")
+        wf(output_dir / "job1_v2.partial.zip", b"partial")
+        wf(output_dir / "job1.status", "done")
+        wf(output_dir / "notes.txt", "ignored")
+
+        sync_output_dir(output_dir, nc_out, synced, mock_job_logger)
+
+        assert synced == {"job1_v1.zip"}
+        assert sorted(p.name for p in nc_out.iterdir()) == ["job1.status", "job1_v1.zip"]
+
     def test_no_output_dir_is_noop(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, tmp_path: Path, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
     ) -> None:
         """When local_output_dir doesn't exist, nothing happens."""
-        nc_out = tmp_path / "nc" / "output"
-        nc_out.mkdir(parents=True)
-        synced: set[str] = set()
+        _, nc_out, synced = out_ctx
 
-        sync_output_zips(tmp_path / "nonexistent", nc_out, synced, mock_job_logger)
+        sync_output_dir(tmp_path / "nonexistent", nc_out, synced, mock_job_logger)
 
         assert synced == set()
 
 
-# ---------------------------------------------------------------------------
-# sync_output_status_files
-# ---------------------------------------------------------------------------
-
-
 class TestSyncOutputStatusFiles:
     def test_copies_status_files(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
     ) -> None:
-        output_dir = tmp_path / "output"
-        output_dir.mkdir()
-        (output_dir / "job1.status").write_text("done | 5 iterations")
+        output_dir, nc_out, synced = out_ctx
+        wf(output_dir / "job1.status", "done | 5 iterations")
 
-        nc_out = tmp_path / "nc" / "output"
-        nc_out.mkdir(parents=True)
-
-        sync_output_status_files(output_dir, nc_out, mock_job_logger)
+        sync_output_dir(output_dir, nc_out, synced, mock_job_logger)
 
         assert (nc_out / "job1.status").read_text() == "done | 5 iterations"
+        assert synced == set()
 
     def test_no_output_dir_is_noop(
-        self, tmp_path: Path, mock_job_logger: logging.Logger
+        self, tmp_path: Path, out_ctx: tuple[Path, Path, set[str]], mock_job_logger: logging.Logger
     ) -> None:
-        nc_out = tmp_path / "nc" / "output"
-        nc_out.mkdir(parents=True)
+        _, nc_out, synced = out_ctx
 
-        sync_output_status_files(tmp_path / "nonexistent", nc_out, mock_job_logger)
+        sync_output_dir(tmp_path / "nonexistent", nc_out, synced, mock_job_logger)
 
         assert list(nc_out.iterdir()) == []
+
+
+# ---------------------------------------------------------------------------
+# DirWatcher
+# ---------------------------------------------------------------------------
+
+
+class TestDirWatcher:
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+
+    def test_reports_changes_per_key(self, tmp_path: Path) -> None:
+        logs_dir = tmp_path / "logs"
+        out_dir = tmp_path / "output"
+        logs_dir.mkdir()
+        out_dir.mkdir()
+        watcher = DirWatcher({"logs": logs_dir, "output": out_dir}, self.MASK)
+        try:
+            if watcher.fileno() < 0:
+                assert watcher.read_events() is None
+                return
+            assert watcher.read_events() == []
+
+            wf(logs_dir / "iter-1.log", "hello\n")
+            wf(out_dir / "job1_v1.partial.zip", b"zip")
+            (out_dir / "job1_v1.partial.zip").rename(out_dir / "job1_v1.zip")
+
+            events = watcher.read_events()
+            assert events is not None
+            assert ("logs", "iter-1.log") in {(k, n) for k, n, _ in events}
+            moved = [n for k, n, m in events if k == "output" and m & IN_MOVED_TO]
+            assert moved == ["job1_v1.zip"]
+            assert watcher.read_events() == []
+        finally:
+            watcher.close()
+
+    def test_missing_dir_disables_watcher(self, tmp_path: Path) -> None:
+        watcher = DirWatcher({"logs": tmp_path / "nonexistent"}, self.MASK)
+        assert watcher.fileno() == -1
+        assert watcher.read_events() is None
+
+
+# ---------------------------------------------------------------------------
+# run_post_sync_hook
+# ---------------------------------------------------------------------------
+
+
+class TestRunPostSyncHook:
+    def _run(self, tmp_path: Path, logger: logging.Logger, command: str, timeout: int = 10) -> Path:
+        out = tmp_path / "job.log"
+        run_post_sync_hook(
+            command,
+            timeout,
+            job_id="job1",
+            nc_output_dir=tmp_path / "nc",
+            nc_log_dir=None,
+            jlog=logger,
+            output_path=out,
+        )
+        return out
+
+    def test_output_redirected_to_file(
+        self, tmp_path: Path, mock_job_logger: logging.Logger
+    ) -> None:
+        out = self._run(tmp_path, mock_job_logger, 'echo "out $JOB_ID"; echo err >&2')
+        assert out.read_text().splitlines() == ["out job1", "err"]
+
+    def test_timeout_kills_hook(
+        self, tmp_path: Path, mock_job_logger: logging.Logger, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        with caplog.at_level(logging.WARNING, logger=mock_job_logger.name):
+            self._run(tmp_path, mock_job_logger, "exec sleep 5", timeout=0)
+        assert "timed out" in caplog.text
+
+
+# ---------------------------------------------------------------------------
+# LoopWaiter
+# ---------------------------------------------------------------------------
+
+
+class TestLoopWaiter:
+    def test_notify_cuts_wait_short(self, tmp_path: Path) -> None:
+        waiter = LoopWaiter({"input": tmp_path})
+        try:
+            waiter.notify()
+            waiter.notify()  # coalesced with the first
+            start = time.monotonic()
+            waiter.wait(5)
+            assert time.monotonic() - start < 1
+        finally:
+            waiter.close()
+
+    def test_new_file_cuts_wait_short(self, tmp_path: Path) -> None:
+        waiter = LoopWaiter({"input": tmp_path, "missing": tmp_path / "nope"})
+        try:
+            if waiter._watcher.fileno() < 0:
+                pytest.skip("inotify unavailable")
+            wf(tmp_path / "job1.zip", b"zip")
+            start = time.monotonic()
+            waiter.wait(5)
+            assert time.monotonic() - start < 1
+            # Events were drained: the next wait times out.
+            start = time.monotonic()
+            waiter.wait(0.05)
+            assert time.monotonic() - start >= 0.04
+        finally:
+            waiter.close()
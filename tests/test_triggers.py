@@ -1,7 +1,6 @@
 """Unit tests for trigger logic in ralph_loop.py."""
 
 import os
-import time
 from pathlib import Path
 from unittest.mock import patch
 
@@ -107,6 +106,14 @@ class TestReadWriteFloat:
         write_float(f, 1234567890.123)
         assert read_float(f) == pytest.approx(1234567890.123)
 
+    def test_rewrite_after_delete(self, tmp_path: Path) -> None:
+        """A deleted state file is recreated rather than written via a stale fd."""
+        f = tmp_path / "val.txt"
+        write_float(f, 1.5)
+        f.unlink()
+        write_float(f, 2.5)
+        assert read_float(f) == 2.5
+
 
 # ---------------------------------------------------------------------------
 # should_fire_persistent_trigger
@@ -142,18 +149,43 @@ class TestShouldFirePersistentTrigger:
         """After marking handled, a new touch (newer mtime) → fires again."""
         trigger = tmp_path / "trigger.flag"
         trigger.touch()
+        os.utime(trigger, (1_000_000.0, 1_000_000.0))
         state = tmp_path / ".state"
         (state / "trigger").mkdir(parents=True)
 
         mark_persistent_trigger_handled(trigger, state)
         assert should_fire_persistent_trigger(trigger, state) is False
 
-        # Ensure mtime advances (filesystem resolution can be 1s)
-        time.sleep(0.05)
+        # Set a newer mtime explicitly (filesystem resolution can be 1s)
         trigger.write_text("touched again\n")
+        os.utime(trigger, (1_000_001.0, 1_000_001.0))
+
+        assert should_fire_persistent_trigger(trigger, state) is True
+
+    def test_deleting_state_rearms(self, tmp_path: Path) -> None:
+        """Deleting the state file by hand re-arms the trigger despite the cache."""
+        trigger = tmp_path / "trigger.flag"
+        trigger.touch()
+        state = tmp_path / ".state"
+        (state / "trigger").mkdir(parents=True)
+        mark_persistent_trigger_handled(trigger, state)
+        assert should_fire_persistent_trigger(trigger, state) is False
+
+        (state / "trigger" / "trigger.flag.mtime").unlink()
 
         assert should_fire_persistent_trigger(trigger, state) is True
 
+    def test_state_served_from_memory(self, tmp_path: Path) -> None:
+        """An unchanged state file is not read again."""
+        trigger = tmp_path / "trigger.flag"
+        trigger.touch()
+        state = tmp_path / ".state"
+        (state / "trigger").mkdir(parents=True)
+        mark_persistent_trigger_handled(trigger, state)
+
+        with patch("ralph_loop.read_float", side_effect=AssertionError("re-read")):
+            assert should_fire_persistent_trigger(trigger, state) is False
+
 
 # ---------------------------------------------------------------------------
 # mark_persistent_trigger_handled
@@ -0,0 +1,301 @@
+"""Unit tests for helpers in worker/worker.py."""
+
+import os
+import socket
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import worker.worker
+from worker.worker import (
+    CLASSIFY_TAIL_BYTES,
+    WHOLE_READ_MAX_BYTES,
+    classify_log,
+    classify_pattern,
+    extract_job_zip,
+    fast_reset,
+    result_zip_compression,
+    write_if_absent,
+    zip_sources,
+)
+
+_SIGNAL = "RALPH_COMPLETE"
+
+
+def _make_zip(path: Path, members: dict[str, bytes | None]) -> Path:
+    """Write a zip; a None value makes a directory entry."""
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            if data is None:
+                zf.writestr(zipfile.ZipInfo(name), b"")
+            else:
+                zf.writestr(name, data)
+    return path
+
+
+def _tree(root: Path) -> dict[str, bytes | None]:
+    return {
+        p.relative_to(root).as_posix(): None if p.is_dir() else p.read_bytes()
+        for p in sorted(root.rglob("*"))
+    }
+
+
+def test_extract_job_zip_flat(tmp_path: Path) -> None:
+    zip_path = _make_zip(tmp_path / "in.zip", {"a.txt": b"a", "sub/b.txt": b"b"})
+    project = tmp_path / "project"
+    (project / "stale").mkdir(parents=True)
+
+    extract_job_zip(zip_path, project)
+
+    assert _tree(project) == {"a.txt": b"a", "sub": None, "sub/b.txt": b"b"}
+
+
+def test_extract_job_zip_strips_project_prefix(tmp_path: Path) -> None:
+    """Result zips keep files under project/; everything else in them is ignored."""
+    zip_path = _make_zip(
+        tmp_path / "in.zip",
+        {"metadata.txt": b"m", "project/a.txt": b"a", "project/sub/b.txt": b"b", "logs/iter-1.log": b"l"},
+    )
+    project = tmp_path / "project"
+
+    extract_job_zip(zip_path, project)
+
+    assert _tree(project) == {"a.txt": b"a", "sub": None, "sub/b.txt": b"b"}
+
+
+def test_extract_job_zip_directory_entries(tmp_path: Path) -> None:
+    zip_path = _make_zip(tmp_path / "in.zip", {"empty/": None, "sub/": None, "sub/b.txt": b"b"})
+    project = tmp_path / "project"
+
+    extract_job_zip(zip_path, project)
+
+    assert _tree(project) == {"empty": None, "sub": None, "sub/b.txt": b"b"}
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("../evil.txt", "evil.txt"),
+        ("a/../../evil.txt", "a/evil.txt"),
+        ("/abs/evil.txt", "abs/evil.txt"),
+        ("./a/./evil.txt", "a/evil.txt"),
+    ],
+)
+def test_extract_job_zip_stays_inside_project(tmp_path: Path, name: str, expected: str) -> None:
+    zip_path = _make_zip(tmp_path / "in.zip", {name: b"x"})
+    project = tmp_path / "work" / "project"
+
+    extract_job_zip(zip_path, project)
+
+    assert sorted(p.name for p in (tmp_path / "work").iterdir()) == ["project"]
+    assert (project / expected).read_bytes() == b"x"
+
+
+def test_extract_job_zip_streams_large_members(tmp_path: Path) -> None:
+    """Members over WHOLE_READ_MAX_BYTES are streamed and still match byte for byte."""
+    big = os.urandom(WHOLE_READ_MAX_BYTES + (1 << 20) + 7)
+    zip_path = _make_zip(tmp_path / "in.zip", {"big.bin": big, "small.txt": b"s"})
+    project = tmp_path / "project"
+
+    extract_job_zip(zip_path, project)
+
+    assert (project / "big.bin").read_bytes() == big
+    assert (project / "small.txt").read_bytes() == b"s"
+
+
+def test_classify_log_empty_and_missing(tmp_path: Path) -> None:
+    pattern = classify_pattern(_SIGNAL)
+    empty = tmp_path / "iter-1.log"
+    empty.write_bytes(b"")
+
+    assert classify_log(pattern, empty) == (False, False, False, False)
+    assert classify_log(pattern, tmp_path / "missing.log") == (False, False, False, False)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Error: 429 Too Many Requests", (True, False, False, False)),
+        ("PROMPT TOO LONG", (False, True, False, False)),
+        ("Bad Gateway", (False, False, True, False)),
+        (_SIGNAL, (False, False, False, True)),
+        (_SIGNAL.lower(), (False, False, False, False)),
+    ],
+    ids=["rate", "context", "transient", "done", "done-is-case-sensitive"],
+)
+def test_classify_log_groups(tmp_path: Path, text: str, expected: tuple[bool, ...]) -> None:
+    log_file = tmp_path / "iter-1.log"
+    log_file.write_text(f"working...\n{text}\n")
+
+    assert classify_log(classify_pattern(_SIGNAL), log_file) == expected
+
+
+def test_classify_log_reports_every_group(tmp_path: Path) -> None:
+    """One pass of the combined regex sets every flag that appears in the log."""
+    log_file = tmp_path / "iter-1.log"
+    log_file.write_text("rate limit\n502 Bad Gateway\ncontext window\nRALPH_COMPLETE\n")
+
+    assert classify_log(classify_pattern(_SIGNAL), log_file) == (True, True, True, True)
+
+
+def test_classify_pattern_escapes_signal(tmp_path: Path) -> None:
+    log_file = tmp_path / "iter-1.log"
+    log_file.write_text("DONE-anything\n")
+    pattern = classify_pattern("DONE.*")
+
+    assert classify_log(pattern, log_file)[3] is False
+    log_file.write_text("DONE.*\n")
+    assert classify_log(pattern, log_file)[3] is True
+
+
+@pytest.mark.parametrize("padding", [CLASSIFY_TAIL_BYTES - 100, CLASSIFY_TAIL_BYTES + 100])
+def test_classify_log_done_outside_tail(tmp_path: Path, padding: int) -> None:
+    """The completion signal is found on either side of the tail window; errors only inside it."""
+    log_file = tmp_path / "iter-1.log"
+    log_file.write_bytes(b"429\n" + _SIGNAL.encode() + b"\n" + b"x" * padding)
+
+    rate_limited, _, _, completed = classify_log(classify_pattern(_SIGNAL), log_file)
+
+    assert completed
+    assert rate_limited == (padding < CLASSIFY_TAIL_BYTES)
+
+
+def test_fast_reset(tmp_path: Path) -> None:
+    """The dir is empty at once and the renamed-away tree is deleted in the background."""
+    project = tmp_path / "project"
+    (project / "sub").mkdir(parents=True)
+    (project / "sub" / "a.txt").write_text("a")
+
+    fast_reset(project)
+
+    assert list(project.iterdir()) == []
+    worker.worker._cleanup_pool.submit(lambda: None).result()
+    assert [p.name for p in tmp_path.iterdir()] == ["project"]
+
+
+def test_fast_reset_creates_missing_dir(tmp_path: Path) -> None:
+    fast_reset(tmp_path / "new" / "project")
+
+    assert (tmp_path / "new" / "project").is_dir()
+
+
+def test_write_if_absent(tmp_path: Path) -> None:
+    created = tmp_path / "PRD.md"
+    existing = tmp_path / "progress.txt"
+    existing.write_text("step 1\n")
+
+    write_if_absent(created, "# PRD\n")
+    write_if_absent(existing, "# Progress Log\n")
+
+    assert created.read_text() == "# PRD\n"
+    assert existing.read_text() == "step 1\n"
+
+
+@pytest.mark.parametrize(
+    "value, zip_chain_mode, expected",
+    [
+        ("", True, "stored"),
+        ("", False, "default"),
+        ("stored", False, "stored"),
+        (" Fast ", True, "fast"),
+        ("DEFAULT", True, "default"),
+    ],
+)
+def test_result_zip_compression(
+    monkeypatch: pytest.MonkeyPatch, value: str, zip_chain_mode: bool, expected: str
+) -> None:
+    monkeypatch.setenv("RESULT_ZIP_COMPRESSION", value)
+    assert result_zip_compression(zip_chain_mode) == expected
+
+
+def test_result_zip_compression_rejects_unknown(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RESULT_ZIP_COMPRESSION", "bzip2")
+    with pytest.raises(SystemExit, match="Invalid RESULT_ZIP_COMPRESSION: bzip2"):
+        result_zip_compression(False)
+
+
+@pytest.mark.parametrize("compression, compress_type", [("stored", zipfile.ZIP_STORED), ("fast", zipfile.ZIP_DEFLATED)])
+def test_zip_sources_compression(tmp_path: Path, compression: str, compress_type: int) -> None:
+    src = tmp_path / "project"
+    src.mkdir()
+    (src / "a.txt").write_text("a" * 1000)
+    out = tmp_path / "out.zip"
+
+    zip_sources(out, [(src, "project")], [], compression)
+
+    with zipfile.ZipFile(out) as zf:
+        assert zf.getinfo("project/a.txt").compress_type == compress_type
+        assert zf.read("project/a.txt") == b"a" * 1000
+
+
+_FAKE_CLAUDE = """#!/bin/sh
+# Echo the prompt (minus its own mention of the signal) into the iteration
+# log, leave a handoff, finish on run 2.
+sed s/RALPH_COMPLETE/-/
+n=$(($(cat "$FAKE_COUNT" 2>/dev/null || echo 0) + 1))
+echo $n > "$FAKE_COUNT"
+echo "handoff-$n" > next_instruction.txt
+[ "$n" -ge 2 ] && echo RALPH_COMPLETE
+exit 0
+"""
+
+
+def test_zip_chain_carries_handoff(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Each iteration's prompt gets the previous handoff; chain archives are stored."""
+    claude = tmp_path / "claude"
+    claude.write_text(_FAKE_CLAUDE)
+    claude.chmod(0o755)
+    prompt = tmp_path / "prompt.txt"
+    prompt.write_text("task\n")
+    input_zip = _make_zip(tmp_path / "job.zip", {"a.txt": b"a"})
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    work_root = tmp_path / "work"
+    for name, value in {
+        "JOB_ID": "job",
+        "INPUT_ZIP": input_zip,
+        "OUTPUT_DIR": output_dir,
+        "TASK_PROMPT_FILE": prompt,
+        "WORK_ROOT": work_root,
+        "CLAUDE_CMD": claude,
+        "CLAUDE_ARGS": "",
+        "ZIP_CHAIN_MODE": "1",
+        "MAX_ITERATIONS": "3",
+        "FAKE_COUNT": tmp_path / "count",
+    }.items():
+        monkeypatch.setenv(name, str(value))
+    monkeypatch.delenv("RESULT_ZIP_COMPRESSION", raising=False)
+
+    worker.worker.main()
+
+    first = (work_root / "logs" / "iter-1.log").read_text()
+    second = (work_root / "logs" / "iter-2.log").read_text()
+    assert "Previous iteration handoff" not in first
+    assert "Previous iteration handoff:\nhandoff-1\n" in second
+    zips = sorted(output_dir.glob("*.zip"))
+    assert zips
+    for path in zips:
+        with zipfile.ZipFile(path) as zf:
+            assert {info.compress_type for info in zf.infolist()} == {zipfile.ZIP_STORED}
+
+
+def test_zip_sources_skips_special_files(tmp_path: Path) -> None:
+    """Only regular files are archived; sockets, FIFOs and dangling links are skipped."""
+    src = tmp_path / "project"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.txt").write_text("a")
+    (src / "sub" / "b.txt").write_text("b")
+    os.mkfifo(src / "fifo")
+    os.symlink(tmp_path / "missing", src / "dangling")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(str(src / "sock"))
+        out = tmp_path / "out.zip"
+        zip_sources(out, [(src, "project")], [("metadata.txt", b"m")])
+    finally:
+        sock.close()
+
+    with zipfile.ZipFile(out) as zf:
+        assert zf.namelist() == ["metadata.txt", "project/a.txt", "project/sub/b.txt"]
+        assert zf.read("project/sub/b.txt") == b"b"
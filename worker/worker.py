@@ -1,28 +1,29 @@
 #!/usr/bin/env python3
+# zipfile, shutil, subprocess and concurrent.futures are imported where they
+# are used, so the fail-fast env/input checks in main() exit without paying
+# for them (roughly half of the module's cold import time).
+import atexit
+import mmap
 import os
 import re
 import shlex
-import shutil
-import subprocess
 import time
-import zipfile
-from datetime import datetime, timezone
 from pathlib import Path
 
 
-RATE_LIMIT_RE = re.compile(r"rate.?limit|429|too many requests|retry after|quota exceeded", re.IGNORECASE)
+RATE_LIMIT_RE = re.compile(rb"rate.?limit|429|too many requests|retry after|quota exceeded", re.IGNORECASE)
 TRANSIENT_RE = re.compile(
-    r"status code 502|status code 503|status code 504|bad gateway|gateway timeout|service unavailable|temporarily unavailable|upstream",
+    rb"status code 502|status code 503|status code 504|bad gateway|gateway timeout|service unavailable|temporarily unavailable|upstream",
     re.IGNORECASE,
 )
 CONTEXT_RE = re.compile(
-    r"context length|maximum context|prompt too long|input too long|too many tokens|token limit|context window",
+    rb"context length|maximum context|prompt too long|input too long|too many tokens|token limit|context window",
     re.IGNORECASE,
 )
 
 
 def log(message: str) -> None:
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
     print(f"[{ts}] {message}", flush=True)
 
 
@@ -40,64 +41,217 @@ def env_int(name: str, default: int) -> int:
     return int(value)
 
 
+_TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
+
+
 def env_bool(name: str, default: bool) -> bool:
     value = os.environ.get(name)
     if value is None or value == "":
         return default
-    return value.strip().lower() in {"1", "true", "yes", "y", "on"}
+    return value.strip().lower() in _TRUTHY
+
+
+def classify_pattern(complete_signal: str) -> re.Pattern[bytes]:
+    """Bytes union of the rate/context/transient patterns and the (case-sensitive) completion signal."""
+    return re.compile(
+        b"(?P<rate>" + RATE_LIMIT_RE.pattern + b")"
+        b"|(?P<ctx>" + CONTEXT_RE.pattern + b")"
+        b"|(?P<trans>" + TRANSIENT_RE.pattern + b")"
+        b"|(?P<done>(?-i:" + re.escape(complete_signal.encode()) + b"))",
+        re.IGNORECASE,
+    )
+
+
+# Rate/context/transient errors and the completion signal are printed at the
+# end of an iteration, so only the tail of a (possibly huge) log is scanned.
+CLASSIFY_TAIL_BYTES = 256 * 1024
+
+
+def classify_log(pattern: re.Pattern[bytes], log_file: Path) -> tuple[bool, bool, bool, bool]:
+    """
+    Scan the last CLASSIFY_TAIL_BYTES of log_file once with a classify_pattern() regex.
+
+    The file is memory-mapped and matched as bytes from the tail offset, so
+    the log is never decoded or copied and earlier pages are not read. Only
+    when the tail has no completion signal is the rest of the file searched
+    for it, since the agent may keep printing after announcing completion.
+    Returns (rate_limited, context_limited, transient, completed).
+    """
+    found = set()
+    try:
+        f = log_file.open("rb")
+    except FileNotFoundError:
+        return False, False, False, False
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            tail = max(0, size - CLASSIFY_TAIL_BYTES)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for match in pattern.finditer(mm, tail):
+                    found.add(match.lastgroup)
+                    if len(found) == 4:
+                        break
+                if tail and "done" not in found:
+                    for match in pattern.finditer(mm):
+                        if match.start() >= tail:
+                            break
+                        if match.lastgroup == "done":
+                            found.add("done")
+                            break
+    return "rate" in found, "ctx" in found, "trans" in found, "done" in found
+
+
+def read_handoff(path: Path) -> str:
+    try:
+        return path.read_text(encoding="utf-8", errors="ignore").strip()
+    except FileNotFoundError:
+        return ""
 
 
-def detect(pattern: re.Pattern[str], log_file: Path) -> bool:
-    if not log_file.exists():
-        return False
-    return bool(pattern.search(log_file.read_text(encoding="utf-8", errors="ignore")))
+def write_if_absent(path: Path, text: str) -> None:
+    """Create path with text unless it already exists (O_EXCL: one open, no stat)."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return
+    with open(fd, "w", encoding="utf-8") as f:
+        f.write(text)
 
 
-def copy_tree_contents(src: Path, dst: Path) -> None:
-    dst.mkdir(parents=True, exist_ok=True)
-    for item in src.iterdir():
-        target = dst / item.name
-        if item.is_dir():
-            shutil.copytree(item, target, dirs_exist_ok=True)
-        else:
-            shutil.copy2(item, target)
+_cleanup_pool = None
 
 
-def zip_dir(src_dir: Path, zip_path: Path) -> None:
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for path in sorted(src_dir.rglob("*")):
-            if path.is_file():
-                zf.write(path, path.relative_to(src_dir))
+def fast_reset(path: Path) -> None:
+    """Leave *path* as an empty dir; the old contents are deleted in the background."""
+    global _cleanup_pool
+    import shutil
 
+    if _cleanup_pool is None:
+        import concurrent.futures
 
-def extract_job_zip(input_zip: Path, project_dir: Path, scratch_dir: Path) -> None:
+        _cleanup_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="rmtree")
+        atexit.register(_cleanup_pool.shutdown, wait=True)
+    trash = path.with_name(f".{path.name}.deleting-{os.getpid()}-{time.monotonic_ns()}")
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        _cleanup_pool.submit(shutil.rmtree, trash, ignore_errors=True)
+    path.mkdir(parents=True, exist_ok=True)
+
+
+# RESULT_ZIP_COMPRESSION -> (zipfile compression constant name, compresslevel)
+ZIP_COMPRESSION = {
+    "stored": ("ZIP_STORED", None),
+    "fast": ("ZIP_DEFLATED", 1),
+    "default": ("ZIP_DEFLATED", None),
+}
+
+
+def result_zip_compression(zip_chain_mode: bool) -> str:
+    """RESULT_ZIP_COMPRESSION, defaulting to stored in zip-chain mode and to default otherwise."""
+    # Zip-chain archives are re-extracted by the next iteration, so skip deflate there by default.
+    value = os.environ.get("RESULT_ZIP_COMPRESSION", "").strip().lower() or (
+        "stored" if zip_chain_mode else "default"
+    )
+    if value not in ZIP_COMPRESSION:
+        raise SystemExit(f"Invalid RESULT_ZIP_COMPRESSION: {value} (expected stored, fast or default)")
+    return value
+
+
+def zip_sources(
+    zip_path: Path,
+    sources: list[tuple[Path, str]],
+    extra_files: list[tuple[str, bytes]],
+    compression: str = "default",
+) -> None:
+    """
+    Write one zip straight from live directories.
+
+    Each (src_root, prefix) pair lands under "prefix/" in the archive, and
+    extra_files are (arcname, bytes) entries written with writestr, so no
+    staging copy of the tree is needed.
+    """
+    import zipfile
+
+    method, level = ZIP_COMPRESSION[compression]
+    with zipfile.ZipFile(zip_path, "w", compression=getattr(zipfile, method), compresslevel=level) as zf:
+        for arcname, data in extra_files:
+            zf.writestr(arcname, data)
+        for src_root, prefix in sources:
+            stack = [(os.fspath(src_root), prefix)]
+            while stack:
+                dirpath, arc_dir = stack.pop()
+                with os.scandir(dirpath) as it:
+                    # Sort per directory so the archive order stays stable.
+                    entries = sorted(it, key=lambda e: e.name)
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append((entry.path, f"{arc_dir}/{entry.name}"))
+                    elif entry.is_file():
+                        # Regular files (or links to one) only: sockets, FIFOs,
+                        # devices and dangling symlinks are skipped.
+                        zf.write(entry.path, f"{arc_dir}/{entry.name}")
+                stack.extend(reversed(subdirs))
+
+
+# Entries up to this size are inflated in one zlib call and written in one go.
+WHOLE_READ_MAX_BYTES = 2 << 20
+
+
+def extract_job_zip(input_zip: Path, project_dir: Path) -> None:
     """
     Extract a job zip into project_dir.
 
     Supports both:
     - input zips that contain project files at the archive root
     - result zips produced by this worker that contain a top-level "project/" folder
+
+    Small entries are read whole (zipfile decompresses them in a single call)
+    instead of through extract()'s 64 KiB copy loop. Member names are
+    sanitised the way extract() does: empty, "." and ".." parts are dropped.
     """
-    if project_dir.exists():
-        shutil.rmtree(project_dir)
-    project_dir.mkdir(parents=True, exist_ok=True)
+    import shutil
+    import zipfile
 
-    if scratch_dir.exists():
-        shutil.rmtree(scratch_dir)
-    scratch_dir.mkdir(parents=True, exist_ok=True)
+    fast_reset(project_dir)
+    root = os.fspath(project_dir)
+    made = {root}
 
     with zipfile.ZipFile(input_zip, "r") as zf:
-        zf.extractall(scratch_dir)
-
-    nested_project = scratch_dir / "project"
-    src = nested_project if nested_project.is_dir() else scratch_dir
-    copy_tree_contents(src, project_dir)
+        members = zf.infolist()
+        prefix = "project/" if any(info.filename.startswith("project/") for info in members) else ""
+        for info in members:
+            if not info.filename.startswith(prefix):
+                continue
+            parts = [p for p in info.filename[len(prefix):].split("/") if p not in ("", ".", "..")]
+            if not parts:
+                continue
+            target = os.path.join(root, *parts)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                made.add(target)
+                continue
+            parent = os.path.dirname(target)
+            if parent not in made:
+                os.makedirs(parent, exist_ok=True)
+                made.add(parent)
+            if info.file_size <= WHOLE_READ_MAX_BYTES:
+                data = zf.read(info)
+                with open(target, "wb") as dst:
+                    dst.write(data)
+            else:
+                with zf.open(info) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
 
 
 def write_result_archive(
     job_id: str,
     output_dir: Path,
-    result_staging: Path,
     project_dir: Path,
     log_dir: Path,
     start_ts: int,
@@ -105,37 +259,30 @@ def write_result_archive(
     status: str,
     stop_reason: str,
     name_suffix: str,
+    compression: str,
 ) -> Path:
-    if result_staging.exists():
-        shutil.rmtree(result_staging)
-    result_staging.mkdir(parents=True, exist_ok=True)
-
-    metadata = result_staging / "metadata.txt"
-    metadata.write_text(
-        "\n".join(
-            [
-                f"job_id={job_id}",
-                f"status={status}",
-                f"stop_reason={stop_reason or 'none'}",
-                f"started_at_unix={start_ts}",
-                f"ended_at_unix={int(time.time())}",
-                f"iterations_attempted={attempted}",
-                "",
-            ]
-        ),
-        encoding="utf-8",
-    )
-
-    project_stage = result_staging / "project"
-    logs_stage = result_staging / "logs"
-    copy_tree_contents(project_dir, project_stage)
-    copy_tree_contents(log_dir, logs_stage)
+    metadata = "\n".join(
+        [
+            f"job_id={job_id}",
+            f"status={status}",
+            f"stop_reason={stop_reason or 'none'}",
+            f"started_at_unix={start_ts}",
+            f"ended_at_unix={int(time.time())}",
+            f"iterations_attempted={attempted}",
+            "",
+        ]
+    ).encode()
 
     archive_tmp = output_dir / f"{job_id}{name_suffix}.partial.zip"
     archive_final = output_dir / f"{job_id}{name_suffix}.zip"
 
     log(f"[{job_id}] writing result archive {archive_final.name}")
-    zip_dir(result_staging, archive_tmp)
+    zip_sources(
+        archive_tmp,
+        [(log_dir, "logs"), (project_dir, "project")],
+        [("metadata.txt", metadata)],
+        compression,
+    )
     archive_tmp.replace(archive_final)
     return archive_final
 
@@ -146,41 +293,29 @@ def run_iteration(
     log_dir: Path,
     project_dir: Path,
     prompt_text: str,
-    claude_cmd: str,
-    claude_args: str,
+    claude_base_cmd: list[str],
     claude_input_mode: str,
     iter_timeout_seconds: int,
 ) -> int:
+    import subprocess
+
     iter_log = log_dir / f"iter-{iteration}.log"
     log(f"[{job_id}] iteration {iteration} starting")
 
-    cmd = [claude_cmd, *shlex.split(claude_args)]
-    if claude_input_mode != "stdin":
-        cmd.extend(["-p", prompt_text])
+    cmd = claude_base_cmd if claude_input_mode == "stdin" else [*claude_base_cmd, "-p", prompt_text]
 
     try:
-        with iter_log.open("w", encoding="utf-8") as f:
-            if claude_input_mode == "stdin":
-                completed = subprocess.run(
-                    cmd,
-                    input=prompt_text,
-                    text=True,
-                    stdout=f,
-                    stderr=subprocess.STDOUT,
-                    timeout=iter_timeout_seconds,
-                    cwd=str(project_dir),
-                    check=False,
-                )
-            else:
-                completed = subprocess.run(
-                    cmd,
-                    text=True,
-                    stdout=f,
-                    stderr=subprocess.STDOUT,
-                    timeout=iter_timeout_seconds,
-                    cwd=str(project_dir),
-                    check=False,
-                )
+        # The child writes raw bytes straight to the log fd; no text layer needed.
+        with iter_log.open("wb") as f:
+            completed = subprocess.run(
+                cmd,
+                input=prompt_text.encode() if claude_input_mode == "stdin" else None,
+                stdout=f,
+                stderr=subprocess.STDOUT,
+                timeout=iter_timeout_seconds,
+                cwd=str(project_dir),
+                check=False,
+            )
     except subprocess.TimeoutExpired:
         log(f"[{job_id}] iteration {iteration} timed out")
         return 124
@@ -197,8 +332,6 @@ def main() -> None:
     work_root = Path(os.environ.get("WORK_ROOT", "/tmp/work"))
     project_dir = work_root / "project"
     log_dir = work_root / "logs"
-    result_staging = work_root / "result"
-    scratch_dir = work_root / "extract"
 
     max_iterations = env_int("MAX_ITERATIONS", 8)
     max_seconds = env_int("MAX_SECONDS", 3600)
@@ -215,17 +348,23 @@ def main() -> None:
     prd_file_name = os.environ.get("PRD_FILE", "PRD.md")
     progress_file_name = os.environ.get("PROGRESS_FILE", "progress.txt")
     version_offset = env_int("VERSION_OFFSET", 0)
+    zip_compression = result_zip_compression(zip_chain_mode)
     project_dir.mkdir(parents=True, exist_ok=True)
     log_dir.mkdir(parents=True, exist_ok=True)
-    result_staging.mkdir(parents=True, exist_ok=True)
-    scratch_dir.mkdir(parents=True, exist_ok=True)
 
     if not input_zip.is_file():
         raise SystemExit(f"Input zip not found: {input_zip}")
     if not task_prompt_file.is_file():
         raise SystemExit(f"Task prompt file not found: {task_prompt_file}")
 
+    classify_re = classify_pattern(complete_signal)
+    # Each iteration is a fresh `claude --print` run by design (no chat context
+    # carries over), so only the argv is shared across iterations.
+    claude_base_cmd = [claude_cmd, *shlex.split(claude_args)]
+    # Wall clock only for the *_at_unix metadata; the time budget uses the
+    # monotonic clock so NTP steps cannot shrink or stretch it.
     start_ts = int(time.time())
+    start_mono = time.monotonic()
     status = "done"
     stop_reason = ""
 
@@ -238,8 +377,30 @@ def main() -> None:
 
         log(f"[{job_id}] zip-chain mode enabled")
 
+        # project_dir is the same path every iteration; only the handoff text changes.
+        progress_file = project_dir / progress_file_name
+        prd_file = project_dir / prd_file_name
+        next_instruction_file = project_dir / next_instruction_file_name
+        prompt_prefix = "".join(
+            [
+                f"@{prd_file_name} @{progress_file_name}\n\n",
+                f"{task_prompt}\n\n",
+                f"Project path: {project_dir}\n",
+                "Ralph rules:\n",
+                "1) Read the PRD and progress file\n",
+                "2) Find the next incomplete/highest-priority task and implement it\n",
+                "3) Run tests/typechecks/linters if present\n",
+                "4) Commit your changes\n",
+                f"5) Append your progress to {progress_file_name}\n",
+                f"6) Before finishing, update {next_instruction_file_name} with a self-contained instruction for the next iteration (assume no chat context)\n",
+                "7) ONLY DO ONE TASK AT A TIME\n",
+                f"8) If the PRD is complete, output {complete_signal}\n",
+            ]
+        )
+
+        handoff_text = None
         while iteration <= max_iterations:
-            remaining = max_seconds - (int(time.time()) - start_ts)
+            remaining = max_seconds - (time.monotonic() - start_mono)
             if remaining <= soft_stop_margin_seconds:
                 status = "stopped_rate_limit"
                 stop_reason = "soft_budget_guard"
@@ -247,37 +408,19 @@ def main() -> None:
                 break
 
             log(f"[{job_id}] unpacking zip for iteration {iteration}: {current_zip.name}")
-            extract_job_zip(current_zip, project_dir, scratch_dir)
-
-            progress_file = project_dir / progress_file_name
-            prd_file = project_dir / prd_file_name
-            next_instruction_file = project_dir / next_instruction_file_name
-
-            if not progress_file.exists():
-                progress_file.write_text("# Progress Log\n\n", encoding="utf-8")
-            if not prd_file.exists():
-                prd_file.write_text("# PRD\n\n- [ ] Define tasks\n", encoding="utf-8")
-
-            handoff_text = ""
-            if next_instruction_file.exists():
-                handoff_text = next_instruction_file.read_text(encoding="utf-8", errors="ignore").strip()
-
-            prompt_text = (
-                f"@{prd_file_name} @{progress_file_name}\n\n"
-                f"{task_prompt}\n\n"
-                f"Project path: {project_dir}\n"
-                "Ralph rules:\n"
-                "1) Read the PRD and progress file\n"
-                "2) Find the next incomplete/highest-priority task and implement it\n"
-                "3) Run tests/typechecks/linters if present\n"
-                f"4) Commit your changes\n"
-                f"5) Append your progress to {progress_file_name}\n"
-                f"6) Before finishing, update {next_instruction_file_name} with a self-contained instruction for the next iteration (assume no chat context)\n"
-                f"7) ONLY DO ONE TASK AT A TIME\n"
-                f"8) If the PRD is complete, output {complete_signal}\n"
-            )
+            extract_job_zip(current_zip, project_dir)
+
+            write_if_absent(progress_file, "# Progress Log\n\n")
+            write_if_absent(prd_file, "# PRD\n\n- [ ] Define tasks\n")
+
+            if handoff_text is None:
+                # First iteration: the handoff (if any) comes from the input zip.
+                handoff_text = read_handoff(next_instruction_file)
+
             if handoff_text:
-                prompt_text += "\nPrevious iteration handoff:\n" + handoff_text + "\n"
+                prompt_text = prompt_prefix + "\nPrevious iteration handoff:\n" + handoff_text + "\n"
+            else:
+                prompt_text = prompt_prefix
 
             attempted += 1
             rc = run_iteration(
@@ -286,33 +429,37 @@ def main() -> None:
                 log_dir,
                 project_dir,
                 prompt_text,
-                claude_cmd,
-                claude_args,
+                claude_base_cmd,
                 claude_input_mode,
                 iter_timeout_seconds,
             )
+            # The next iteration extracts this same project tree from the
+            # archive below, so keep the handoff in memory rather than
+            # re-reading it after extraction.
+            handoff_text = read_handoff(next_instruction_file)
 
             iter_log = log_dir / f"iter-{iteration}.log"
+            rate_limited, context_limited, transient, completed = classify_log(classify_re, iter_log)
 
             iter_status = "in_progress"
             iter_stop_reason = ""
             hard_stop = False
 
-            if rc != 0 and detect(RATE_LIMIT_RE, iter_log):
+            if rc != 0 and rate_limited:
                 iter_status = "stopped_rate_limit"
                 iter_stop_reason = "rate_limit_detected"
                 status = iter_status
                 stop_reason = iter_stop_reason
                 hard_stop = True
                 log(f"[{job_id}] hard stop due to rate-limit signal")
-            elif rc != 0 and detect(CONTEXT_RE, iter_log):
+            elif rc != 0 and context_limited:
                 iter_status = "stopped_context_limit"
                 iter_stop_reason = "context_limit_detected"
                 status = iter_status
                 stop_reason = iter_stop_reason
                 hard_stop = True
                 log(f"[{job_id}] hard stop due to context-limit signal")
-            elif rc != 0 and detect(TRANSIENT_RE, iter_log):
+            elif rc != 0 and transient:
                 consecutive_transient_errors += 1
                 log(
                     f"[{job_id}] transient upstream error detected "
@@ -332,7 +479,7 @@ def main() -> None:
                 stop_reason = iter_stop_reason
                 hard_stop = True
                 log(f"[{job_id}] worker failed with rc={rc}")
-            elif complete_signal in iter_log.read_text(encoding="utf-8", errors="ignore"):
+            elif completed:
                 iter_status = "done"
                 iter_stop_reason = "complete_signal"
                 status = iter_status
@@ -351,11 +498,12 @@ def main() -> None:
                 stop_reason = iter_stop_reason
                 hard_stop = True
 
+            # Written synchronously: the next iteration extracts exactly this
+            # archive, and the zip reads project_dir, which claude rewrites next.
             name_suffix = f"_v{version_offset + iteration}"
             current_zip = write_result_archive(
                 job_id=job_id,
                 output_dir=output_dir,
-                result_staging=result_staging,
                 project_dir=project_dir,
                 log_dir=log_dir,
                 start_ts=start_ts,
@@ -363,13 +511,14 @@ def main() -> None:
                 status=iter_status,
                 stop_reason=iter_stop_reason,
                 name_suffix=name_suffix,
+                compression=zip_compression,
             )
             (output_dir / f"{job_id}{name_suffix}.status").write_text(f"{iter_status}\n", encoding="utf-8")
 
             if hard_stop:
                 break
 
-            if rc != 0 and detect(TRANSIENT_RE, iter_log):
+            if rc != 0 and transient:
                 time.sleep(transient_backoff_seconds)
 
             iteration += 1
@@ -379,6 +528,8 @@ def main() -> None:
         log(f"[{job_id}] completed with status={status}")
         return
 
+    import zipfile
+
     log(f"[{job_id}] unpacking input zip")
     with zipfile.ZipFile(input_zip, "r") as zf:
         zf.extractall(project_dir)
@@ -386,10 +537,8 @@ def main() -> None:
     progress_file = project_dir / progress_file_name
     prd_file = project_dir / prd_file_name
 
-    if not progress_file.exists():
-        progress_file.write_text("# Progress Log\n\n", encoding="utf-8")
-    if not prd_file.exists():
-        prd_file.write_text("# PRD\n\n- [ ] Define tasks\n", encoding="utf-8")
+    write_if_absent(progress_file, "# Progress Log\n\n")
+    write_if_absent(prd_file, "# PRD\n\n- [ ] Define tasks\n")
 
     task_prompt = task_prompt_file.read_text(encoding="utf-8")
     prompt_text = (
@@ -414,7 +563,7 @@ def main() -> None:
     consecutive_transient_errors = 0
 
     while iteration <= max_iterations:
-        remaining = max_seconds - (int(time.time()) - start_ts)
+        remaining = max_seconds - (time.monotonic() - start_mono)
         if remaining <= soft_stop_margin_seconds:
             status = "stopped_rate_limit"
             stop_reason = "soft_budget_guard"
@@ -428,27 +577,27 @@ def main() -> None:
             log_dir,
             project_dir,
             prompt_text,
-            claude_cmd,
-            claude_args,
+            claude_base_cmd,
             claude_input_mode,
             iter_timeout_seconds,
         )
 
         iter_log = log_dir / f"iter-{iteration}.log"
+        rate_limited, context_limited, transient, completed = classify_log(classify_re, iter_log)
         if rc != 0:
-            if detect(RATE_LIMIT_RE, iter_log):
+            if rate_limited:
                 status = "stopped_rate_limit"
                 stop_reason = "rate_limit_detected"
                 log(f"[{job_id}] hard stop due to rate-limit signal")
                 break
 
-            if detect(CONTEXT_RE, iter_log):
+            if context_limited:
                 status = "stopped_context_limit"
                 stop_reason = "context_limit_detected"
                 log(f"[{job_id}] hard stop due to context-limit signal")
                 break
 
-            if detect(TRANSIENT_RE, iter_log):
+            if transient:
                 consecutive_transient_errors += 1
                 log(
                     f"[{job_id}] transient upstream error detected "
@@ -473,7 +622,7 @@ def main() -> None:
             log(f"[{job_id}] worker failed with rc={rc}")
             break
 
-        if complete_signal in iter_log.read_text(encoding="utf-8", errors="ignore"):
+        if completed:
             status = "done"
             stop_reason = "complete_signal"
             log(f"[{job_id}] completion signal detected")
@@ -486,50 +635,33 @@ def main() -> None:
         status = "stopped_iteration_cap"
         stop_reason = "max_iterations_reached"
 
-    summary_file = project_dir / "WORKER_SUMMARY.md"
-    if not summary_file.exists():
-        summary_file.write_text(
-            "\n".join(
-                [
-                    "# Worker Summary",
-                    "",
-                    f"- job_id: {job_id}",
-                    f"- status: {status}",
-                    f"- stop_reason: {stop_reason or 'none'}",
-                    f"- iterations_attempted: {attempted}",
-                    "",
-                ]
-            ),
-            encoding="utf-8",
-        )
-
-    metadata = result_staging / "metadata.txt"
-    metadata.write_text(
+    write_if_absent(
+        project_dir / "WORKER_SUMMARY.md",
         "\n".join(
             [
-                f"job_id={job_id}",
-                f"status={status}",
-                f"stop_reason={stop_reason or 'none'}",
-                f"started_at_unix={start_ts}",
-                f"ended_at_unix={int(time.time())}",
-                f"iterations_attempted={attempted}",
+                "# Worker Summary",
+                "",
+                f"- job_id: {job_id}",
+                f"- status: {status}",
+                f"- stop_reason: {stop_reason or 'none'}",
+                f"- iterations_attempted: {attempted}",
                 "",
             ]
         ),
-        encoding="utf-8",
     )
 
-    project_stage = result_staging / "project"
-    logs_stage = result_staging / "logs"
-    copy_tree_contents(project_dir, project_stage)
-    copy_tree_contents(log_dir, logs_stage)
-
-    archive_tmp = output_dir / f"{job_id}.result.partial.zip"
-    archive_final = output_dir / f"{job_id}.result.zip"
-
-    log(f"[{job_id}] writing result archive")
-    zip_dir(result_staging, archive_tmp)
-    archive_tmp.replace(archive_final)
+    write_result_archive(
+        job_id=job_id,
+        output_dir=output_dir,
+        project_dir=project_dir,
+        log_dir=log_dir,
+        start_ts=start_ts,
+        attempted=attempted,
+        status=status,
+        stop_reason=stop_reason,
+        name_suffix=".result",
+        compression=zip_compression,
+    )
 
     status_file = output_dir / f"{job_id}.status"
     status_file.write_text(f"{status}\n", encoding="utf-8")